@@ -3,14 +3,85 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import datetime
+import json
+
+import dashboard_data
+from chart_cache import ChartCache
+from chart_data import OhlcPyramid, downsample
 
 # Load tickers and stock price data
-stock_df = pd.read_csv("./data/nasdaq100_tickers.csv").sort_values(by="Ticker")
-stock_price = pd.read_csv("./data/nasdaq100_stock_prices.csv", parse_dates=["date"])
+stock_df = dashboard_data.load_tickers()
+
+
+# Price data partitioned by ticker and sorted by date, loaded once per server
+@st.cache_resource
+def load_price_store():
+    return dashboard_data.load_price_store()
+
+price_store = load_price_store()
+
+
+# Screening metrics of all tickers, computed in one pass and shared by all sessions
+@st.cache_resource
+def load_screener():
+    return dashboard_data.load_screener(price_store, stock_df)
+
+screener = load_screener()
+
+
+# Daily/weekly/monthly/quarterly bars per ticker, shared by all sessions
+@st.cache_resource
+def load_price_pyramid():
+    return OhlcPyramid(price_store)
+
+price_pyramid = load_price_pyramid()
+
+
+# Serialized chart payloads keyed by (ticker, start, end, timeframe), shared by all sessions
+@st.cache_resource
+def load_chart_cache():
+    return ChartCache(max_bytes=128 * 2 ** 20)
+
+chart_cache = load_chart_cache()
 
-# Ensure the first unnamed index column is removed (if it exists)
-if stock_price.columns[0] == "Unnamed: 0":
-    stock_price = stock_price.drop(columns=["Unnamed: 0"])
+
+@st.cache_data
+def load_dma_results():
+    return pd.read_csv("./assets/dma/results.csv")
+
+
+# DDQN model served with micro-batching, loaded once per server (needs TensorFlow)
+@st.cache_resource
+def load_inference_service():
+    from inference import InferenceService
+    return InferenceService("ADBE_model.keras")
+
+
+# Model observations of a ticker, read through the per-ticker feature cache
+@st.cache_resource
+def load_model_features(ticker):
+    from trading_env import DataSource
+    return DataSource(ticker=ticker, data_path="./data/nasdaq100_stock_prices_plus_features.csv").data
+
+
+# Greedy model actions over the last trading year and the resulting NAVs (no st.* calls)
+def build_live_strategy(ticker, trading_days=252):
+    from trading_env import simulate_episodes
+    service = load_inference_service()
+    observations = load_model_features(ticker).values[-trading_days - 1:]
+    _, actions = service.predict(observations[:-1])
+    result = simulate_episodes(actions, observations[1:, 0], trading_cost_bps=1e-3, time_cost_bps=1e-4)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(y=result["nav"], mode="lines", name="AI Strategy", line=dict(color="green")))
+    fig.add_trace(go.Scatter(y=result["market_nav"], mode="lines", name="Buy & Hold", line=dict(color="red")))
+    fig.add_trace(go.Scatter(y=result["position"], mode="lines", name="Position", yaxis="y2", line=dict(color="gray", width=1, shape="hv")))
+    fig.update_layout(xaxis_title="Trading Day", yaxis_title="NAV",
+                      yaxis2=dict(title="Position", overlaying="y", side="right", range=[-1.5, 1.5], tickvals=[-1, 0, 1]))
+    counts = np.bincount(actions, minlength=3)
+    summary = (f"Last {len(actions)} trading days: {counts[2]} long, {counts[1]} neutral, {counts[0]} short · "
+               f"Agent NAV {result['nav'][-1]:.3f} vs Market {result['market_nav'][-1]:.3f}")
+    return {"chart": fig.to_json(), "summary": summary}
 
 # Extract all tickers from the CSV for dropdown
 tickers_list = stock_df["Ticker"].tolist()
@@ -34,6 +105,9 @@ with st.sidebar:
     st.markdown("<h3 style='font-size:18px;'>📌 Select Stock for Analysis</h3>", unsafe_allow_html=True)
     selected_ticker = st.selectbox("Choose a Stock:", tickers_list, format_func=lambda x: ticker_display[x])
 
+    # Page Selection
+    page = st.radio("View:", ["Stock Overview", "Market Screener"], horizontal=True)
+
     # Date Selection (Moved back to Sidebar)
     st.markdown("<h3 style='font-size:18px;'>📅 Select Date Range</h3>", unsafe_allow_html=True)
     start_date = st.date_input("Start Date", datetime.date(2005, 1, 1))
@@ -42,29 +116,7 @@ with st.sidebar:
     # --- Market Trends (Only for Top Stocks) ---
     st.markdown("<h3 style='font-size:18px;'>🔥 Market Trends</h3>", unsafe_allow_html=True)
 
-    @st.cache_data
-    def fetch_stock_info(tickers):
-        stock_info = {}
-        for ticker in tickers:
-            df = stock_price[stock_price["ticker"] == ticker].sort_values("date")
-            if df.empty:
-                continue
-            valid_data = df["close"].dropna()
-            if len(valid_data) < 2:
-                continue
-
-            latest_close = float(valid_data.iloc[-1])
-            prev_close = float(valid_data.iloc[-2])
-            price_change = latest_close - prev_close
-
-            stock_info[ticker] = {
-                "latest_price": latest_close,
-                "price_change": price_change,
-                "data": valid_data
-            }
-        return stock_info
-
-    stock_data = fetch_stock_info(top_stocks)
+    stock_data = dashboard_data.fetch_stock_info(screener, top_stocks)
 
     # Display Stock Info in Sidebar (Only for Top Stocks)
     for ticker, info in stock_data.items():
@@ -102,73 +154,127 @@ with st.sidebar:
 st.markdown("<h1 style='font-size:36px; padding-top:0px'>⚡️ ThorEMore</h1>", unsafe_allow_html=True)
 st.markdown("<p style='font-size:16px;'>Optimizing Adaptive Reinforcement Learning for Stock Trading: Smaller and Faster Models</p>", unsafe_allow_html=True)
 
+# --- Market Screener ---
+screener_columns = {
+    "company": "Company", "sector": "Sector", "close": "Close", "change": "Change",
+    "pct_change": "Change (%)", "return_5d": "1W (%)", "return_21d": "1M (%)", "return_63d": "3M (%)",
+    "return_252d": "1Y (%)", "above_sma50": "> SMA50", "above_sma200": "> SMA200",
+    "golden_cross": "SMA50 > SMA200", "volatility": "Volatility (%)", "drawdown": "Drawdown (%)",
+    "dma_sharpe": "DMA Sharpe",
+}
+percent_columns = ["pct_change", "return_5d", "return_21d", "return_63d", "return_252d", "volatility", "drawdown"]
+
+if page == "Market Screener":
+    st.markdown("<h1 style='font-size:28px;'>🔎 Market Screener</h1>", unsafe_allow_html=True)
+    sectors = st.multiselect("Sectors:", sorted(stock_df["Sector"].dropna().unique()))
+    table = screener.table(sectors)[list(screener_columns)].copy()
+    table[percent_columns] *= 100
+    st.caption(f"{len(table)} stocks · last close {screener.last_date:%Y-%m-%d}")
+    st.dataframe(
+        table.rename(columns=screener_columns).sort_values("1Y (%)", ascending=False),
+        use_container_width=True,
+        height=600,
+        column_config={label: st.column_config.NumberColumn(format="%.2f")
+                       for name, label in screener_columns.items() if name not in ("company", "sector")
+                       and not name.startswith(("above", "golden"))},
+    )
+    st.write("""
+    **💡 Metrics Explanation**
+    - **Volatility**: Annualized standard deviation of the last 63 daily returns.
+    - **Drawdown**: Decline of the last close from its all-time high.
+    - **DMA Sharpe**: Sharpe ratio of the 50/200-day Dual Moving Average Crossover Strategy over the full history.
+    """)
+    st.stop()
+
 st.markdown(f"<h1 style='font-size:28px;'>📈 {ticker_display[selected_ticker]} Stock Overview</h1>", unsafe_allow_html=True)
 
 # Timeframe Selection (Reversed Order)
+timeframes = ["ALL", "10Y", "5Y", "1Y", "6M", "3M", "1M"]  # Reordered options
 timeframe = st.radio(
     "Select Timeframe:",
-    ["ALL", "10Y", "5Y", "1Y", "6M", "3M", "1M"],  # Reordered options
+    timeframes,
     horizontal=True
 )
+timeframe_offsets = {
+    "10Y": pd.DateOffset(years=10),
+    "5Y": pd.DateOffset(years=5),
+    "1Y": pd.DateOffset(years=1),
+    "6M": pd.DateOffset(months=6),
+    "3M": pd.DateOffset(months=3),
+    "1M": pd.DateOffset(months=1),
+}
 
 
-# Fetch Stock Data
-@st.cache_data
+# Fetch Stock Data (binary search on the ticker's sorted dates)
 def get_stock_data(ticker, st, ed):
-    df = stock_price[(stock_price["ticker"] == ticker) & 
-                     (stock_price["date"] >= pd.Timestamp(st)) & 
-                     (stock_price["date"] <= pd.Timestamp(ed))]
-    df = df.sort_values("date").reset_index(drop=True)
-    return df
-
-data = get_stock_data(selected_ticker, start_date, end_date)
-
-# Filter data based on selected timeframe
-end_date = data["date"].max()
-if timeframe == "1M":
-    start_date = end_date - pd.DateOffset(months=1)
-elif timeframe == "3M":
-    start_date = end_date - pd.DateOffset(months=3)
-elif timeframe == "6M":
-    start_date = end_date - pd.DateOffset(months=6)
-elif timeframe == "1Y":
-    start_date = end_date - pd.DateOffset(years=1)
-elif timeframe == "5Y":
-    start_date = end_date - pd.DateOffset(years=5)
-elif timeframe == "10Y":
-    start_date = end_date - pd.DateOffset(years=10)
-else:
-    start_date = data["date"].min()
+    return dashboard_data.get_stock_data(price_store, ticker, st, ed)
 
-data = data[(data["date"] >= start_date) & (data["date"] <= end_date)]
 
-# Ensure data is valid
-if data.empty:
-    st.warning(f"⚠️ No valid data found for {selected_ticker}. Try a different stock or date range.")
-else:
+# Filter data based on selected timeframe, counted back from the last date in range
+def get_timeframe_data(ticker, st, ed, timeframe):
+    data = get_stock_data(ticker, st, ed)
+    if not data.empty and timeframe in timeframe_offsets:
+        data = data.iloc[data["date"].searchsorted(data["date"].iloc[-1] - timeframe_offsets[timeframe]):]
+    return data.reset_index(drop=True)
+
+
+# Build every chart of the overview as serialized Plotly figures (no st.* calls: may run on a prefetch thread)
+def build_charts(ticker, st, ed, timeframe):
+    data = get_timeframe_data(ticker, st, ed, timeframe)
+    if data.empty:
+        return None
+
+    # Coarsest bars needed for the range: daily up to a few hundred bars, then weekly, monthly, quarterly
+    level, bars = price_pyramid.select(ticker, data["date"].iloc[0], data["date"].iloc[-1])
+
     # --- Candlestick Chart ---
     fig = go.Figure()
     fig.add_trace(go.Candlestick(
-        x=data["date"], open=data["open"], high=data["high"],
-        low=data["low"], close=data["close"],
+        x=bars["date"], open=bars["open"], high=bars["high"],
+        low=bars["low"], close=bars["close"],
         name="OHLC", increasing_line_color="green", decreasing_line_color="red"
     ))
 
-    # Moving Averages
-    data["SMA_50"] = data["close"].rolling(window=50).mean()
-    data["SMA_200"] = data["close"].rolling(window=200).mean()
-    fig.add_trace(go.Scatter(x=data["date"], y=data["SMA_50"], mode="lines", name="SMA 50", line=dict(color="blue", width=1)))
-    fig.add_trace(go.Scatter(x=data["date"], y=data["SMA_200"], mode="lines", name="SMA 200", line=dict(color="orange", width=1)))
+    # Moving Averages (daily series over the range, downsampled with LTTB)
+    daily = price_pyramid.daily(ticker, data["date"].iloc[0], data["date"].iloc[-1])
+    sma_50_x, sma_50_y = downsample(daily["date"], daily["SMA_50"])
+    sma_200_x, sma_200_y = downsample(daily["date"], daily["SMA_200"])
+    fig.add_trace(go.Scatter(x=sma_50_x, y=sma_50_y, mode="lines", name="SMA 50", line=dict(color="blue", width=1)))
+    fig.add_trace(go.Scatter(x=sma_200_x, y=sma_200_y, mode="lines", name="SMA 200", line=dict(color="orange", width=1)))
 
-    fig.update_layout(title=f"{ticker_display[selected_ticker]} - Stock Price", xaxis_title="Date", yaxis_title="Price", xaxis_rangeslider_visible=False)
-    st.plotly_chart(fig, use_container_width=True)
+    fig.update_layout(title=f"{ticker_display.get(ticker, ticker)} - Stock Price ({level})", xaxis_title="Date", yaxis_title="Price", xaxis_rangeslider_visible=False)
+    price_chart = fig.to_json()
 
     # --- Feature Engineering Indicators ---
-    st.markdown("<h2 style='font-size:24px;'>🔍 Percentage Change</h2>", unsafe_allow_html=True)
-    data["Returns"] = data["close"].pct_change()
+    returns_x, returns_y = downsample(daily["date"], daily["Returns"])
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=data["date"], y=data["Returns"], mode="lines", name="Returns", line=dict(color="purple")))
-    st.plotly_chart(fig, use_container_width=True)
+    fig.add_trace(go.Scatter(x=returns_x, y=returns_y, mode="lines", name="Daily Returns", line=dict(color="purple")))
+    returns_chart = fig.to_json()
+
+    return {"price": price_chart, "returns": returns_chart}
+
+
+def chart_key(ticker, timeframe):
+    return (ticker, start_date, end_date, timeframe)
+
+
+charts = chart_cache.get_or_build(chart_key(selected_ticker, timeframe), lambda: build_charts(*chart_key(selected_ticker, timeframe)))
+
+# Warm the cache for the likely next clicks: neighbouring timeframes and the sidebar's top stocks
+position = timeframes.index(timeframe)
+for neighbour in timeframes[max(0, position - 1):position + 2]:
+    chart_cache.prefetch(chart_key(selected_ticker, neighbour), lambda k=chart_key(selected_ticker, neighbour): build_charts(*k))
+for ticker in top_stocks:
+    chart_cache.prefetch(chart_key(ticker, timeframe), lambda k=chart_key(ticker, timeframe): build_charts(*k))
+
+# Ensure data is valid
+if charts is None:
+    st.warning(f"⚠️ No valid data found for {selected_ticker}. Try a different stock or date range.")
+else:
+    st.plotly_chart(json.loads(charts["price"]), use_container_width=True)
+
+    st.markdown("<h2 style='font-size:24px;'>🔍 Percentage Change</h2>", unsafe_allow_html=True)
+    st.plotly_chart(json.loads(charts["returns"]), use_container_width=True)
 
     # --- Backtesting ---
     st.markdown("<h2 style='font-size:24px;'>📊 Backtesting Performance</h2>", unsafe_allow_html=True)
@@ -176,7 +282,7 @@ else:
     st.markdown("<h3 style='font-size:20px;'>Dual Moving Average Crossover Strategy</h3>", unsafe_allow_html=True)
     st.image(f'assets/dma/{selected_ticker}.png')
     
-    dma = pd.read_csv("./assets/dma/results.csv")
+    dma = load_dma_results()
     dma = dma.loc[dma['ticker'] == selected_ticker, ['sharpe', 'drawdown']].T.rename(index={"sharpe": "Sharpe Ratio", "drawdown": "Drawdown"})
     dma.columns = ["Value"]
     st.dataframe(dma, use_container_width=True)
@@ -187,14 +293,15 @@ else:
     """)
     
     st.markdown("<h3 style='font-size:20px;'>Our Trading Strategy</h3>", unsafe_allow_html=True)
-    st.image("results/trading_bot/performance.png")
-    data["Strategy Returns"] = np.where(data["close"].pct_change() > 0, data["close"].pct_change(), 0).cumsum()
-    data["Benchmark Returns"] = data["close"].pct_change().cumsum()
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=data["date"], y=data["Strategy Returns"], mode="lines", name="AI Strategy", line=dict(color="green")))
-    fig.add_trace(go.Scatter(x=data["date"], y=data["Benchmark Returns"], mode="lines", name="Benchmark", line=dict(color="red")))
-    # st.plotly_chart(fig, use_container_width=True)
+    try:
+        live_strategy = chart_cache.get_or_build(("live", selected_ticker), lambda: build_live_strategy(selected_ticker))
+    except Exception:  # model, TensorFlow or feature data not available
+        live_strategy = None
+    if live_strategy is None:
+        st.image("results/trading_bot/performance.png")
+    else:
+        st.plotly_chart(json.loads(live_strategy["chart"]), use_container_width=True)
+        st.caption(live_strategy["summary"])
 
 # --- Development Team ---
 st.markdown("""
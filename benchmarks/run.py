@@ -0,0 +1,322 @@
+"""
+Benchmark suite for data loading, the trading environment and app queries
+
+Runs on the deterministic synthetic dataset of benchmarks/synthetic.py (same
+schema and scale as the NASDAQ-100 data) and reports:
+
+- load: DataSource construction from the CSV and from the feature cache,
+  cache build, load_data and preprocess_data (seconds and peak MB)
+- env: TradingEnvironment resets/steps per second (and the median time of
+  each step phase from an instrumented run), VectorTradingEnvironment and
+  TradingSimulator steps per second
+- app: load time of the dashboard's data and per-call latency of its
+  get_stock_data and fetch_stock_info (dashboard_data, Streamlit caching
+  bypassed), next to the boolean-mask versions they replaced
+
+Results are written as JSON; with --baseline, every metric is compared with a
+stored run and regressions beyond --tolerance are reported (exit status 1).
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --output new.json --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dashboard_data  # noqa: E402
+import feature_cache  # noqa: E402
+import instrumentation  # noqa: E402
+from trading_env import (DataSource, TradingEnvironment, TradingSimulator,  # noqa: E402
+                         VectorTradingEnvironment)
+
+import synthetic  # noqa: E402
+
+SECONDS, MB, PER_SEC, US = 's', 'MB', '1/s', 'us'
+
+
+def metric(value, unit, higher_is_better=False):
+    return {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def measure(fn, repeat=3):
+    """Runs fn repeat times untraced, then once under tracemalloc
+
+    Returns (result, best seconds, peak traced MB).
+    """
+    best = np.inf
+    with contextlib.redirect_stdout(io.StringIO()):  # DataSource prints frame info
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def rate(fn, n, repeat=3):
+    """Best of repeat runs of n calls of fn; returns calls per second"""
+    best = np.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return n / best
+
+
+def latency_us(fn, args, repeat=3):
+    """Median latency in microseconds of fn(*a) over the argument tuples"""
+    times = []
+    for _ in range(repeat):
+        for a in args:
+            started = time.perf_counter()
+            fn(*a)
+            times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1e6
+
+
+def bench_load(paths, ticker, cache_dir):
+    results = {}
+    features = paths[synthetic.FEATURES_FILE]
+
+    _, elapsed, peak = measure(lambda: DataSource(ticker=ticker, data_path=features, cache_dir=None))
+    results['load.csv_seconds'] = metric(elapsed, SECONDS)
+    results['load.csv_peak_mb'] = metric(peak, MB)
+
+    _, elapsed, peak = measure(lambda: feature_cache.build_cache(features, cache_dir))
+    results['load.cache_build_seconds'] = metric(elapsed, SECONDS)
+    results['load.cache_build_peak_mb'] = metric(peak, MB)
+
+    source, elapsed, peak = measure(lambda: DataSource(ticker=ticker, data_path=features, cache_dir=cache_dir))
+    results['load.cache_seconds'] = metric(elapsed, SECONDS)
+    results['load.cache_peak_mb'] = metric(peak, MB)
+
+    _, elapsed, _ = measure(source.load_data)
+    results['load.load_data_seconds'] = metric(elapsed, SECONDS)
+
+    def preprocess():
+        source.data = source.load_data()
+        source.preprocess_data()
+    _, elapsed, peak = measure(preprocess)
+    elapsed -= results['load.load_data_seconds']['value']
+    results['load.preprocess_seconds'] = metric(elapsed, SECONDS)
+    results['load.preprocess_peak_mb'] = metric(peak, MB)
+    results['load.rows'] = metric(len(source.data), 'rows', higher_is_better=True)
+    return results
+
+
+def bench_env(paths, ticker, cache_dir, trading_days, n_envs, n_steps):
+    results = {}
+    features = paths[synthetic.FEATURES_FILE]
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = TradingEnvironment(trading_days=trading_days, ticker=ticker,
+                                 data_path=features, cache_dir=cache_dir)
+    env.seed(42)
+    rng = np.random.default_rng(0)
+    actions = iter(rng.integers(0, 3, 4 * n_steps).tolist())
+
+    def step():
+        if env.step(next(actions))[2]:
+            env.reset()
+
+    results['env.resets_per_sec'] = metric(rate(env.reset, 1000), PER_SEC, True)
+    env.reset()
+    results['env.steps_per_sec'] = metric(rate(step, n_steps), PER_SEC, True)
+
+    registry = instrumentation.Registry()
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = TradingEnvironment(trading_days=trading_days, ticker=ticker, data_path=features,
+                                 cache_dir=cache_dir, metrics=registry)
+    env.seed(42)
+    env.reset()
+    actions = iter(rng.integers(0, 3, n_steps).tolist())
+    for _ in range(n_steps):
+        step()
+    for phase in ('assert', 'data', 'simulator', 'total'):
+        median = registry.histogram('env_step_seconds', phase=phase).quantile(.5)
+        results['env.step_{}_us'.format(phase)] = metric(median * 1e6, US)
+
+    simulator = TradingSimulator(trading_days, 1e-3, 1e-4)
+    market_returns = rng.normal(0, 0.02, trading_days)
+    sim_actions = rng.integers(0, 3, trading_days)
+
+    def episode():
+        simulator.reset()
+        for action, market_return in zip(sim_actions, market_returns):
+            simulator.take_step(action, market_return)
+
+    results['simulator.steps_per_sec'] = metric(rate(episode, 20) * trading_days, PER_SEC, True)
+    results['simulator.result_us'] = metric(latency_us(simulator.result, [()] * 100), US)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        venv = VectorTradingEnvironment(n_envs=n_envs, trading_days=trading_days, ticker=ticker,
+                                        data_path=features, cache_dir=cache_dir)
+    venv.seed(42)
+    venv.reset()
+    batch = rng.integers(0, 3, (n_envs,))
+    n_batches = max(n_steps // n_envs, 100)
+    results['vector_env.steps_per_sec'] = metric(rate(lambda: venv.step(batch), n_batches) * n_envs,
+                                                 PER_SEC, True)
+    results['vector_env.n_envs'] = metric(n_envs, 'envs', True)
+    return results
+
+
+def bench_app(paths, n_queries, seed=0):
+    """Times the dashboard's loaders and queries (dashboard_data, called
+    directly so that Streamlit's caches are bypassed) next to the single
+    frame and boolean masks of the dashboard before PriceStore/Screener"""
+    results = {}
+    prices_path = paths[synthetic.PRICES_FILE]
+    stock_df = dashboard_data.load_tickers(paths[synthetic.TICKERS_FILE])
+
+    def baseline_load():
+        return pd.read_csv(prices_path, parse_dates=['date'])
+
+    def baseline_get_stock_data(ticker, st, ed):
+        df = stock_price[(stock_price['ticker'] == ticker) &
+                         (stock_price['date'] >= pd.Timestamp(st)) &
+                         (stock_price['date'] <= pd.Timestamp(ed))]
+        df = df.sort_values('date').reset_index(drop=True)
+        return df
+
+    def baseline_fetch_stock_info(tickers):
+        stock_info = {}
+        for ticker in tickers:
+            df = stock_price[stock_price['ticker'] == ticker].sort_values('date')
+            if df.empty:
+                continue
+            valid_data = df['close'].dropna()
+            if len(valid_data) < 2:
+                continue
+            latest_close = float(valid_data.iloc[-1])
+            prev_close = float(valid_data.iloc[-2])
+            stock_info[ticker] = {'latest_price': latest_close,
+                                  'price_change': latest_close - prev_close,
+                                  'data': valid_data}
+        return stock_info
+
+    stock_price, elapsed, peak = measure(baseline_load)
+    results['app.load_baseline_seconds'] = metric(elapsed, SECONDS)
+    results['app.load_baseline_peak_mb'] = metric(peak, MB)
+    store, elapsed, peak = measure(lambda: dashboard_data.load_price_store(prices_path))
+    results['app.load_seconds'] = metric(elapsed, SECONDS)
+    results['app.load_peak_mb'] = metric(peak, MB)
+    screener, elapsed, peak = measure(lambda: dashboard_data.load_screener(store, stock_df))
+    results['app.screener_build_seconds'] = metric(elapsed, SECONDS)
+    results['app.screener_peak_mb'] = metric(peak, MB)
+
+    rng = np.random.default_rng(seed)
+    dates = stock_price['date'].sort_values().unique()
+    tickers = rng.choice(store.tickers, n_queries)
+    bounds = np.sort(rng.choice(dates, (n_queries, 2)), axis=1)
+    queries = [(t, pd.Timestamp(lo), pd.Timestamp(hi)) for t, (lo, hi) in zip(tickers, bounds)]
+    # the sidebar asks for 10 tickers per run
+    sidebars = [(list(rng.choice(store.tickers, min(10, len(store.tickers)), replace=False)),)
+                for _ in range(max(n_queries // 10, 5))]
+
+    results['app.get_stock_data_us'] = metric(
+        latency_us(lambda *q: dashboard_data.get_stock_data(store, *q), queries), US)
+    results['app.get_stock_data_baseline_us'] = metric(latency_us(baseline_get_stock_data, queries), US)
+    results['app.fetch_stock_info_us'] = metric(
+        latency_us(lambda t: dashboard_data.fetch_stock_info(screener, t), sidebars), US)
+    results['app.fetch_stock_info_baseline_us'] = metric(latency_us(baseline_fetch_stock_info, sidebars), US)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns rows (name, baseline, current, relative change, status)"""
+    rows = []
+    for name, current in results['metrics'].items():
+        if name not in baseline['metrics']:
+            rows.append((name, None, current['value'], None, 'new'))
+            continue
+        before = baseline['metrics'][name]['value']
+        change = (current['value'] - before) / before if before else 0.0
+        worse = -change if current['higher_is_better'] else change
+        status = 'regressed' if worse > tolerance else 'improved' if worse < -tolerance else 'ok'
+        rows.append((name, before, current['value'], change, status))
+    return rows
+
+
+def format_report(results, rows=None):
+    lines = []
+    if rows is None:
+        for name, m in results['metrics'].items():
+            lines.append('{:<32} {:>14.4g} {}'.format(name, m['value'], m['unit']))
+        return '\n'.join(lines)
+    lines.append('{:<32} {:>12} {:>12} {:>9}  {}'.format('metric', 'baseline', 'current', 'change', 'status'))
+    for name, before, current, change, status in rows:
+        lines.append('{:<32} {:>12} {:>12.4g} {:>9}  {}'.format(
+            name, '-' if before is None else '{:.4g}'.format(before), current,
+            '-' if change is None else '{:+.1%}'.format(change), status))
+    return '\n'.join(lines)
+
+
+def run(args):
+    data_dir = args.data_dir or os.path.join(
+        tempfile.gettempdir(), 'dlweek-bench-{}x{}-s{}'.format(args.tickers, args.years, args.seed))
+    started = time.perf_counter()
+    paths = synthetic.write_dataset(data_dir, args.tickers, args.years, args.seed)
+    generate_seconds = time.perf_counter() - started
+    ticker = args.ticker or synthetic.ticker_table(args.tickers).Ticker.iloc[0]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        metrics = {}
+        metrics.update(bench_load(paths, ticker, cache_dir))
+        metrics.update(bench_env(paths, ticker, cache_dir, args.trading_days, args.n_envs, args.steps))
+        metrics.update(bench_app(paths, args.queries, args.seed))
+
+    return {'meta': {'tickers': args.tickers, 'years': args.years, 'seed': args.seed,
+                     'ticker': ticker, 'trading_days': args.trading_days,
+                     'data_dir': data_dir, 'generate_seconds': generate_seconds,
+                     'python': platform.python_version(), 'numpy': np.__version__,
+                     'pandas': pd.__version__, 'machine': platform.machine(),
+                     'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'metrics': metrics}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks loading, environment and app queries')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative change reported as a regression')
+    parser.add_argument('--data-dir', help='synthetic dataset directory (reused if present)')
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ticker', help='ticker for the environment benchmarks')
+    parser.add_argument('--trading-days', type=int, default=252)
+    parser.add_argument('--n-envs', type=int, default=64)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(results, json.load(f), args.tolerance)
+        print(format_report(results, rows))
+        sys.exit(1 if any(row[-1] == 'regressed' for row in rows) else 0)
+    print(format_report(results))
@@ -0,0 +1,102 @@
+"""
+Deterministic synthetic NASDAQ-100-shaped dataset for benchmarks
+
+The real data/nasdaq100_stock_prices_plus_features.csv is a Git LFS pointer in
+a fresh checkout. This module generates data with the same schema and scale:
+about 100 tickers over 20 years of business days, random-walk OHLCV prices,
+staggered listing dates (like ABNB or APP), and the features of
+preprocess.ipynb (dollar_vol*, return_*, target_*, year, month).
+
+    python benchmarks/synthetic.py --out /tmp/bench-data --tickers 100 --years 20
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import feature_pipeline  # noqa: E402
+
+TICKERS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'nasdaq100_tickers.csv')
+PRICES_FILE = 'nasdaq100_stock_prices.csv'
+FEATURES_FILE = 'nasdaq100_stock_prices_plus_features.csv'
+TICKERS_FILE = 'nasdaq100_tickers.csv'
+
+
+def ticker_table(n_tickers):
+    """Ticker, Company, Sector rows: the real constituents, then synthetic ones"""
+    tickers = pd.read_csv(TICKERS_PATH)
+    extra = n_tickers - len(tickers)
+    if extra > 0:
+        tickers = pd.concat([tickers, pd.DataFrame({
+            'Ticker': ['SYN{:03d}'.format(i) for i in range(extra)],
+            'Company': ['Synthetic {}'.format(i) for i in range(extra)],
+            'Sector': tickers.Sector.values[np.arange(extra) % len(tickers)]})])
+    return tickers.head(n_tickers).reset_index(drop=True)
+
+
+def generate_prices(n_tickers=100, years=20, seed=0):
+    """Long-format (date, open, close, high, low, volume, ticker, company, sector)"""
+    rng = np.random.default_rng(seed)
+    tickers = ticker_table(n_tickers)
+    dates = pd.bdate_range('2005-01-03', periods=252 * years)
+    frames = []
+    for i, row in tickers.iterrows():
+        # every fifth ticker lists somewhere in the first 15 years
+        start = int(rng.integers(0, 252 * min(years - 1, 15))) if i % 5 == 4 else 0
+        n = len(dates) - start
+        close = 20 * np.exp(rng.normal(0, 1)) * np.exp(np.cumsum(rng.normal(3e-4, 0.02, n)))
+        spread = np.abs(rng.normal(0, 0.01, n))
+        frames.append(pd.DataFrame({'date': dates[start:],
+                                    'open': close * (1 + rng.normal(0, 0.005, n)),
+                                    'close': close,
+                                    'high': close * (1 + spread),
+                                    'low': close * (1 - spread),
+                                    'volume': rng.lognormal(14, 1, n).round(),
+                                    'ticker': row.Ticker,
+                                    'company': row.Company,
+                                    'sector': row.Sector}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def add_features(price_df):
+    """Adds the feature columns exactly as preprocess.ipynb does"""
+    return feature_pipeline.notebook_features(price_df)
+
+
+def write_dataset(out_dir, n_tickers=100, years=20, seed=0):
+    """Writes the prices, features and tickers CSVs; returns their paths
+
+    Existing files generated with the same parameters are reused.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, name) for name in (PRICES_FILE, FEATURES_FILE, TICKERS_FILE)}
+    stamp = os.path.join(out_dir, 'params.txt')
+    params = '{} {} {}'.format(n_tickers, years, seed)
+    if all(os.path.exists(p) for p in paths.values()) and os.path.exists(stamp):
+        with open(stamp) as f:
+            if f.read() == params:
+                return paths
+
+    prices = generate_prices(n_tickers, years, seed)
+    ticker_table(n_tickers).to_csv(paths[TICKERS_FILE], index=False)
+    prices.to_csv(paths[PRICES_FILE])
+    add_features(prices).to_csv(paths[FEATURES_FILE])
+    with open(stamp, 'w') as f:
+        f.write(params)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes a synthetic NASDAQ-100-shaped dataset')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for path in write_dataset(args.out, args.tickers, args.years, args.seed).values():
+        print(path)
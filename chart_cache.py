@@ -0,0 +1,125 @@
+"""
+Size-bounded, prefetching cache of chart payloads for the dashboard
+
+ChartCache maps keys such as (ticker, start, end, timeframe) to built chart
+payloads (serialized Plotly figures and derived indicator series). It is
+meant to be created once per server (st.cache_resource) so that every
+session shares it.
+
+- The cache is bounded by the approximate size in bytes of its payloads and
+  evicts the least recently used entries first.
+- prefetch() builds payloads on a background thread pool, so that likely
+  next clicks (neighbouring timeframes, other top stocks) hit the cache.
+- Concurrent requests for a key that is being built wait for that build
+  instead of building it again.
+
+Builders run outside of Streamlit's script thread and must not call st.*.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def payload_size(value):
+    """Approximate size in bytes of a payload"""
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ChartCache:
+    """Thread-safe LRU cache bounded by payload bytes, with prefetching"""
+
+    def __init__(self, max_bytes=128 * 2 ** 20, workers=2):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (payload, size)
+        self._pending = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chart-prefetch')
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        return default
+
+    def put(self, key, payload):
+        size = payload_size(payload)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (payload, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def _build(self, key, build, future):
+        try:
+            payload = build()
+            self.put(key, payload)
+            future.set_result(payload)
+        except Exception as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _claim(self, key):
+        """Returns (payload or future, owner); owner must build the key"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0], False
+            if key in self._pending:
+                return self._pending[key], False
+            self.misses += 1
+            future = self._pending[key] = Future()
+            return future, True
+
+    def get_or_build(self, key, build):
+        """Returns the cached payload for key, building it (once) if missing"""
+        result, owner = self._claim(key)
+        if owner:
+            self._build(key, build, result)
+        return result.result() if isinstance(result, Future) else result
+
+    def prefetch(self, key, build):
+        """Builds key in the background unless it is cached or being built"""
+        result, owner = self._claim(key)
+        if owner:
+            self._pool.submit(self._build, key, build, result)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size,
+                    'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'pending': len(self._pending)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
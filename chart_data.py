@@ -0,0 +1,139 @@
+"""
+Multi-resolution OHLC pyramid and line downsampling for the dashboard
+
+For long timeframes the dashboard would otherwise send every daily bar to
+Plotly. OhlcPyramid keeps, per ticker, the daily bars plus weekly, monthly
+and quarterly OHLCV aggregates. Every level carries SMA_50/SMA_200 (the daily
+moving averages over the full history, sampled at the end of each period)
+and Returns (pct_change of the level's close). select() returns the finest
+level that fits a bar budget for the requested date range.
+
+Line traces are drawn from the daily series instead (daily() clips it to the
+range), downsampled by lttb() with Largest-Triangle-Three-Buckets, which
+keeps the visual shape (peaks and troughs) of a series at a fixed number of
+points.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# (name, resample rule), finest first
+LEVELS = [('Daily', None), ('Weekly', 'W-FRI'), ('Monthly', 'ME'), ('Quarterly', 'QE')]
+MAX_BARS = 400
+MAX_LINE_POINTS = 800
+
+
+def with_indicators(daily):
+    """Returns the daily bars with SMA_50, SMA_200 and Returns columns"""
+    daily = daily[['date', 'open', 'high', 'low', 'close', 'volume']].reset_index(drop=True)
+    daily['SMA_50'] = daily['close'].rolling(window=50).mean()
+    daily['SMA_200'] = daily['close'].rolling(window=200).mean()
+    daily['Returns'] = daily['close'].pct_change()
+    return daily
+
+
+def aggregate(daily, rule):
+    """Aggregates daily bars (with indicators) into OHLCV bars per period
+
+    Each bar is dated by the last trading day of its period.
+    """
+    bars = (daily.assign(last_date=daily['date'])
+            .set_index('date')
+            .resample(rule)
+            .agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+                  'volume': 'sum', 'SMA_50': 'last', 'SMA_200': 'last',
+                  'last_date': 'last'})
+            .dropna(subset=['close']))
+    bars = bars.rename(columns={'last_date': 'date'}).reset_index(drop=True)
+    bars['Returns'] = bars['close'].pct_change()
+    return bars[['date', 'open', 'high', 'low', 'close', 'volume', 'SMA_50', 'SMA_200', 'Returns']]
+
+
+def build_pyramid(daily):
+    """Returns {level name: bars} for one ticker's date-sorted daily prices"""
+    daily = with_indicators(daily)
+    return {name: daily if rule is None else aggregate(daily, rule)
+            for name, rule in LEVELS}
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling; returns selected indices
+
+    x must be increasing and numeric (e.g. datetime64 viewed as int64); y must
+    not contain NaN.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # average of the next bucket (or the last point)
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        nx, ny = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(dates, values, n_out=MAX_LINE_POINTS):
+    """Returns (dates, values) of a line trace reduced to about n_out points
+
+    Missing values (e.g. the SMA warm-up) are dropped before downsampling.
+    """
+    valid = ~pd.isna(values)
+    dates, values = np.asarray(dates)[valid], np.asarray(values)[valid]
+    idx = lttb(dates.astype('datetime64[ns]').astype(np.int64), values, n_out)
+    return dates[idx], values[idx]
+
+
+class OhlcPyramid:
+    """Per-ticker pyramid of OHLCV levels, built on first use from a PriceStore"""
+
+    def __init__(self, price_store, max_bars=MAX_BARS):
+        self.price_store = price_store
+        self.max_bars = max_bars
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def levels(self, ticker):
+        with self._lock:
+            if ticker not in self._levels:
+                self._levels[ticker] = build_pyramid(self.price_store.ticker(ticker))
+            return self._levels[ticker]
+
+    def build_all(self):
+        for ticker in self.price_store.tickers:
+            self.levels(ticker)
+
+    def select(self, ticker, start, end):
+        """Returns (level name, bars) of the finest level with at most
+        max_bars bars dated within [start, end]"""
+        for name, bars in self.levels(ticker).items():
+            lo, hi = _bounds(bars, start, end)
+            if hi - lo <= self.max_bars:
+                break
+        return name, bars.iloc[lo:hi]
+
+    def daily(self, ticker, start, end):
+        """Returns the daily bars (with indicators) dated within [start, end]"""
+        bars = self.levels(ticker)['Daily']
+        lo, hi = _bounds(bars, start, end)
+        return bars.iloc[lo:hi]
+
+
+def _bounds(bars, start, end):
+    """Returns the [lo, hi) rows of bars dated within [start, end]"""
+    dates = bars['date'].values
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    lo = np.searchsorted(dates, np.datetime64(start, 'ns').astype(dates.dtype), side='left')
+    hi = np.searchsorted(dates, np.datetime64(end, 'ns').astype(dates.dtype), side='right')
+    return lo, hi
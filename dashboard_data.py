@@ -0,0 +1,53 @@
+"""
+Data loaders and queries of the dashboard, free of st.* calls
+
+app.py wraps the load_* functions in st.cache_resource and runs the queries
+on the cached objects; benchmarks/run.py calls the same functions directly,
+so that it times the dashboard's own code paths without Streamlit's caches.
+"""
+
+import numpy as np
+import pandas as pd
+
+from price_store import PriceStore
+from screener import Screener
+
+PRICES_PATH = './data/nasdaq100_stock_prices.csv'
+TICKERS_PATH = './data/nasdaq100_tickers.csv'
+
+
+def load_tickers(path=TICKERS_PATH):
+    """Returns the Ticker, Company, Sector table sorted by ticker"""
+    return pd.read_csv(path).sort_values(by='Ticker')
+
+
+def load_price_store(path=PRICES_PATH):
+    """Price data partitioned by ticker and sorted by date"""
+    return PriceStore.from_csv(path)
+
+
+def load_screener(price_store, stock_df):
+    """Screening metrics of all tickers, computed in one pass"""
+    return Screener.from_store(price_store, stock_df)
+
+
+def get_stock_data(price_store, ticker, start, end):
+    """Returns the prices of ticker dated within [start, end] (binary search
+    on the ticker's sorted dates)"""
+    return price_store.range(ticker, start, end)
+
+
+def fetch_stock_info(screener, tickers):
+    """Returns {ticker: latest price, last change and recent closes} for the
+    tickers with at least two closes"""
+    table = screener.table()
+    stock_info = {}
+    for ticker in tickers:
+        if ticker not in table.index or np.isnan(table.at[ticker, 'change']):
+            continue
+        stock_info[ticker] = {
+            'latest_price': float(table.at[ticker, 'close']),
+            'price_change': float(table.at[ticker, 'change']),
+            'data': screener.recent_closes(ticker)
+        }
+    return stock_info
@@ -0,0 +1,163 @@
+"""
+Vectorized Dual Moving Average (DMA) crossover backtest
+
+Evaluates DMA crossovers for every ticker and a grid of (fast, slow) windows
+in one pass over a (dates x tickers) close price matrix, with the trading and
+time costs of TradingSimulator (via trading_env.simulate_episodes).
+
+Strategy: after the close of day t the strategy is long if SMA(fast) >
+SMA(slow), otherwise short (or flat with allow_short=False), and holds that
+position over day t + 1. It is flat while either SMA is undefined. Days
+before a ticker is listed are not traded and cost nothing.
+
+Writes, to out_dir:
+- results.csv  sharpe, drawdown, ticker for the selected (fast, slow) pair,
+               the schema of assets/dma/results.csv
+- grid.csv     sharpe, drawdown, ticker, fast, slow for every pair
+- equity.npy   float32 NAV curves with shape (pairs, tickers, dates)
+- equity.json  the pairs, tickers and dates indexing equity.npy
+
+Usage:
+    python dma_backtest.py [--prices PATH] [--out DIR] [--fast 10 20 50]
+                           [--slow 100 200] [--select 50 200]
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from trading_env import simulate_episodes
+
+log = logging.getLogger(__name__)
+
+PRICES_PATH = './data/nasdaq100_stock_prices.csv'
+TRADING_DAYS = 252
+
+
+def price_matrix(price_df):
+    """Pivots long-format (date, ticker, close) prices to dates x tickers"""
+    prices = price_df.pivot_table(index='date', columns='ticker', values='close', aggfunc='last')
+    return prices.sort_index()
+
+
+def moving_averages(closes, windows):
+    """Returns {window: SMA matrix}; NaN until window valid closes are seen"""
+    valid = ~np.isnan(closes)
+    zeros = np.zeros((1, closes.shape[1]))
+    total = np.concatenate([zeros, np.cumsum(np.where(valid, closes, 0), axis=0)])
+    count = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    averages = {}
+    for window in windows:
+        sma = np.full(closes.shape, np.nan)
+        if window <= len(closes):
+            n = count[window:] - count[:-window]
+            sums = total[window:] - total[:-window]
+            sma[window - 1:] = np.where(n == window, sums / window, np.nan)
+        averages[window] = sma
+    return averages
+
+
+def max_drawdown(navs):
+    """Largest peak-to-trough decline of navs along the last axis, as fraction"""
+    peaks = np.maximum.accumulate(navs, axis=-1)
+    return np.max(1 - navs / peaks, axis=-1)
+
+
+def sharpe_ratio(returns, mask):
+    """Annualized Sharpe ratio of daily returns over the days where mask is True"""
+    n = mask.sum(axis=-1)
+    mean = np.where(mask, returns, 0).sum(axis=-1) / np.maximum(n, 1)
+    var = np.where(mask, (returns - mean[..., None]) ** 2, 0).sum(axis=-1) / np.maximum(n - 1, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(TRADING_DAYS) * mean / np.sqrt(var)
+
+
+def backtest(prices, pairs, trading_cost_bps=1e-3, time_cost_bps=1e-4,
+             allow_short=True, chunk_size=8):
+    """Backtests every (fast, slow) pair on every ticker of prices
+
+    prices is a dates x tickers DataFrame of closes. Returns a DataFrame with
+    one row per (pair, ticker) (columns sharpe, drawdown, ticker, fast, slow)
+    and the float32 NAV curves with shape (pairs, tickers, dates).
+    """
+    closes = prices.values.astype(np.float64)
+    n_dates, n_tickers = closes.shape
+    with np.errstate(divide='ignore', invalid='ignore'):
+        market_returns = np.nan_to_num(closes[1:] / closes[:-1] - 1, nan=0, posinf=0, neginf=0)
+    market_returns = np.concatenate([np.zeros((1, n_tickers)), market_returns]).T
+    listed = np.maximum.accumulate(~np.isnan(closes), axis=0).T  # (tickers, dates)
+
+    averages = moving_averages(closes, sorted({w for pair in pairs for w in pair}))
+    short_action = 0 if allow_short else 1
+    equity = np.empty((len(pairs), n_tickers, n_dates), dtype=np.float32)
+    sharpe = np.empty((len(pairs), n_tickers))
+    drawdown = np.empty((len(pairs), n_tickers))
+
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        fast = np.stack([averages[f].T for f, _ in chunk])
+        slow = np.stack([averages[s].T for _, s in chunk])
+        actions = np.where(fast > slow, 2, short_action)
+        actions = np.where(np.isnan(fast) | np.isnan(slow), 1, actions)
+        result = simulate_episodes(actions, market_returns, trading_cost_bps,
+                                   time_cost_bps, mask=listed)
+        rows = slice(start, start + len(chunk))
+        equity[rows] = result['nav']
+        sharpe[rows] = sharpe_ratio(result['strategy_return'], listed)
+        drawdown[rows] = max_drawdown(result['nav'])
+
+    grid = pd.DataFrame({'sharpe': sharpe.ravel(),
+                         'drawdown': drawdown.ravel(),
+                         'ticker': np.tile(prices.columns.values, len(pairs)),
+                         'fast': np.repeat([f for f, _ in pairs], n_tickers),
+                         'slow': np.repeat([s for _, s in pairs], n_tickers)})
+    return grid, equity
+
+
+def write_results(out_dir, prices, pairs, grid, equity, select):
+    """Writes results.csv, grid.csv, equity.npy and equity.json to out_dir"""
+    os.makedirs(out_dir, exist_ok=True)
+    selected = grid[(grid.fast == select[0]) & (grid.slow == select[1])]
+    selected[['sharpe', 'drawdown', 'ticker']].to_csv(os.path.join(out_dir, 'results.csv'), index=False)
+    grid.to_csv(os.path.join(out_dir, 'grid.csv'), index=False)
+    np.save(os.path.join(out_dir, 'equity.npy'), equity)
+    with open(os.path.join(out_dir, 'equity.json'), 'w') as f:
+        json.dump({'pairs': [list(map(int, pair)) for pair in pairs],
+                   'tickers': list(prices.columns),
+                   'dates': [d.strftime('%Y-%m-%d') for d in pd.to_datetime(prices.index)]}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--prices', default=PRICES_PATH)
+    parser.add_argument('--out', default='./results/dma')
+    parser.add_argument('--fast', type=int, nargs='+', default=[5, 10, 20, 50])
+    parser.add_argument('--slow', type=int, nargs='+', default=[100, 150, 200])
+    parser.add_argument('--select', type=int, nargs=2, default=[50, 200],
+                        help='(fast, slow) pair written to results.csv')
+    parser.add_argument('--trading-cost-bps', type=float, default=1e-3)
+    parser.add_argument('--time-cost-bps', type=float, default=1e-4)
+    parser.add_argument('--long-only', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pairs = [(f, s) for f in args.fast for s in args.slow if f < s]
+    if tuple(args.select) not in pairs:
+        pairs.append(tuple(args.select))
+    prices = price_matrix(pd.read_csv(args.prices, parse_dates=['date']))
+
+    start = time.perf_counter()
+    grid, equity = backtest(prices, pairs, args.trading_cost_bps, args.time_cost_bps,
+                            allow_short=not args.long_only)
+    log.info('backtested {} pairs x {} tickers x {} days in {:.2f}s'.format(
+        len(pairs), prices.shape[1], prices.shape[0], time.perf_counter() - start))
+    write_results(args.out, prices, pairs, grid, equity, args.select)
+
+
+if __name__ == '__main__':
+    main()
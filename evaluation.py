@@ -0,0 +1,159 @@
+"""
+Walk-forward batch evaluation of a trained trading model
+
+Evaluates a saved model greedily on walk-forward episodes of every ticker and
+regenerates results/trading_bot/results.csv (Agent, Market, Difference,
+Strategy Wins (%)) for them.
+
+A greedy action only depends on the current observation, so instead of
+stepping a TradingEnvironment with one model call per day, every feature row
+of a ticker is scored in large batches and all episodes are then run at once
+by simulate_episodes() (identical to stepping TradingSimulator). Tickers are
+loaded and preprocessed in a process pool.
+
+Episode k of a ticker starts at row start + k * stride (stride defaults to
+trading_days, i.e. consecutive non-overlapping windows) and, as in
+TradingEnvironment, trades the actions chosen on rows o .. o + T - 1 against
+the returns of rows o + 1 .. o + T.
+
+    python evaluation.py --model ADBE_model.keras --tickers ADBE AMD --out results/evaluation
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import feature_cache
+from inference import MODEL_PATH, load_keras_model
+from trading_env import CACHE_DIR, DataSource, simulate_episodes
+
+log = logging.getLogger(__name__)
+
+DATA_PATH = './data/nasdaq100_stock_prices_plus_features.csv'
+TICKERS_PATH = './data/nasdaq100_tickers.csv'
+BATCH_SIZE = 8192
+WINS_WINDOW = 100
+
+
+def load_ticker(ticker, trading_days=252, data_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Returns the preprocessed features and dates of a ticker"""
+    source = DataSource(trading_days=trading_days, ticker=ticker,
+                        data_path=data_path, cache_dir=cache_dir)
+    return np.ascontiguousarray(source.data.values), source.load_dates().values
+
+
+def walk_forward_offsets(dates, trading_days, stride=None, start=None, end=None):
+    """Returns the start rows of the episodes fully inside [start, end]"""
+    stride = stride or trading_days
+    first = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start))))
+    last = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end)),
+                                                              side='right'))
+    # an episode reads rows o .. o + trading_days
+    return np.arange(first, last - trading_days, stride)
+
+
+def greedy_actions(predict_fn, features, batch_size=BATCH_SIZE):
+    """Returns argmax Q for every row of features, in batches"""
+    features = np.asarray(features, dtype=np.float32)
+    return np.concatenate([np.argmax(predict_fn(features[i:i + batch_size]), axis=-1)
+                           for i in range(0, len(features), batch_size)])
+
+
+def evaluate(tickers, predict_fn, trading_days=252, stride=None, start=None, end=None,
+             trading_cost_bps=1e-3, time_cost_bps=1e-4, batch_size=BATCH_SIZE,
+             data_path=DATA_PATH, cache_dir=CACHE_DIR, workers=None):
+    """Runs the walk-forward episodes of all tickers
+
+    Returns (episodes, curves): one row per episode (ticker, start/end date,
+    Agent, Market, Difference, Strategy Wins (%)) and a dict of (episodes,
+    trading_days) arrays nav, market_nav, position and cost. Strategy Wins
+    is the percentage of the ticker's last (up to) WINS_WINDOW episodes in
+    which the agent beat the market.
+    """
+    if cache_dir == CACHE_DIR:
+        cache_dir = feature_cache.default_cache_dir(data_path)
+    if cache_dir is not None:
+        feature_cache.ensure_cache(data_path, cache_dir)  # once, not in every worker
+    args = ([trading_days] * len(tickers), [data_path] * len(tickers), [cache_dir] * len(tickers))
+    if workers == 1:
+        loaded = list(map(load_ticker, tickers, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(load_ticker, tickers, *args))
+
+    rows, actions, market_returns = [], [], []
+    steps = np.arange(trading_days)
+    for ticker, (features, dates) in zip(tickers, loaded):
+        offsets = walk_forward_offsets(dates, trading_days, stride, start, end)
+        if not len(offsets):
+            log.info('{}: no complete episode in range'.format(ticker))
+            continue
+        ticker_actions = greedy_actions(predict_fn, features[:offsets[-1] + trading_days], batch_size)
+        episode_rows = offsets[:, None] + steps
+        actions.append(ticker_actions[episode_rows])
+        market_returns.append(features[episode_rows + 1, 0])
+        rows.append(pd.DataFrame({'ticker': ticker,
+                                  'offset': offsets,
+                                  'start': dates[offsets],
+                                  'end': dates[offsets + trading_days]}))
+    if not rows:
+        raise ValueError('no complete episode for any ticker')
+
+    result = simulate_episodes(np.concatenate(actions), np.concatenate(market_returns),
+                               trading_cost_bps, time_cost_bps)
+    episodes = pd.concat(rows, ignore_index=True)
+    # final NAV as reported by the training loop: last nav after the last day's return
+    episodes['Agent'] = result['nav'][:, -1] * (1 + result['strategy_return'][:, -1])
+    episodes['Market'] = result['market_nav'][:, -1]
+    episodes['Difference'] = episodes['Agent'] - episodes['Market']
+    # share of the ticker's last WINS_WINDOW episodes (so far) that beat the market
+    episodes['Strategy Wins (%)'] = episodes.groupby('ticker', sort=False)['Difference'].transform(
+        lambda d: (d > 0).rolling(WINS_WINDOW, min_periods=1).mean() * 100)
+    curves = {name: result[name] for name in ('nav', 'market_nav', 'position', 'cost')}
+    return episodes, curves
+
+
+def write_results(episodes, curves, out_dir):
+    """Writes results.csv (the trading-bot schema), episodes.csv,
+    tickers.csv (per-ticker summary) and curves.npz (NAV curves)"""
+    os.makedirs(out_dir, exist_ok=True)
+    episodes[['Agent', 'Market', 'Difference', 'Strategy Wins (%)']].to_csv(
+        os.path.join(out_dir, 'results.csv'), index=False)
+    episodes.to_csv(os.path.join(out_dir, 'episodes.csv'), index=False)
+    summary = episodes.groupby('ticker', sort=False).agg(episodes=('Agent', 'size'),
+                                                         agent=('Agent', 'mean'),
+                                                         market=('Market', 'mean'),
+                                                         wins=('Difference', lambda d: (d > 0).mean()))
+    summary.to_csv(os.path.join(out_dir, 'tickers.csv'))
+    np.savez_compressed(os.path.join(out_dir, 'curves.npz'),
+                        **{name: values.astype(np.float32) for name, values in curves.items()})
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Walk-forward evaluation of a trading model')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--tickers', nargs='*', help='default: all of --tickers-file')
+    parser.add_argument('--tickers-file', default=TICKERS_PATH)
+    parser.add_argument('--data-path', default=DATA_PATH)
+    parser.add_argument('--trading-days', type=int, default=252)
+    parser.add_argument('--stride', type=int, help='rows between episode starts (default: trading days)')
+    parser.add_argument('--start', help='first date of the evaluation range')
+    parser.add_argument('--end', help='last date of the evaluation range')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='./results/evaluation')
+    args = parser.parse_args()
+
+    tickers = args.tickers or pd.read_csv(args.tickers_file)['Ticker'].tolist()
+    episodes, curves = evaluate(tickers, load_keras_model(args.model),
+                                trading_days=args.trading_days, stride=args.stride,
+                                start=args.start, end=args.end, batch_size=args.batch_size,
+                                data_path=args.data_path, workers=args.workers)
+    write_results(episodes, curves, args.out)
+    log.info('evaluated {} episodes of {} tickers; results in {}'.format(
+        len(episodes), episodes['ticker'].nunique(), args.out))
@@ -0,0 +1,181 @@
+"""
+Columnar, ticker-partitioned cache of the feature CSV
+
+The feature CSV holds every NASDAQ-100 ticker in one file, but a DataSource
+only ever needs the rows of a single ticker. The cache converts the CSV once
+into one directory per ticker with one .npy file per column, plus a small
+manifest that records the column names and dtypes, the per-ticker row counts
+and the size/mtime of the source CSV. Loading a ticker then reads only the
+files of the requested ticker and columns.
+
+The cache is rebuilt automatically when the source CSV changes.
+
+Usage:
+    python feature_cache.py [csv_path] [cache_dir]
+"""
+
+import json
+import logging
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+INDEX_FILE = '_index.npy'
+VERSION = 1
+
+
+def default_cache_dir(csv_path):
+    """Returns the cache directory used for csv_path if none is given"""
+    return os.path.splitext(csv_path)[0] + '_cache'
+
+
+def source_signature(csv_path):
+    """Identifies a version of the source CSV by its size and mtime"""
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def read_manifest(cache_dir):
+    """Returns the cache manifest or None if there is no (valid) cache"""
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != VERSION:
+        return None
+    return manifest
+
+
+def is_fresh(csv_path, cache_dir):
+    """True if the cache exists and was built from the current CSV"""
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        return False
+    signature = source_signature(csv_path)
+    return (manifest['source']['size'] == signature['size'] and
+            manifest['source']['mtime_ns'] == signature['mtime_ns'])
+
+
+def _column_file(position):
+    return 'c{:04d}.npy'.format(position)
+
+
+def _mask_file(position):
+    return 'c{:04d}.mask.npy'.format(position)
+
+
+def build_cache(csv_path, cache_dir=None):
+    """Converts csv_path into the columnar cache; returns the manifest
+
+    The CSV is parsed exactly as DataSource parses it (plain pd.read_csv), so
+    frames read back from the cache are identical to the filtered CSV frames.
+    Numeric columns are stored as-is; text columns are stored as fixed-width
+    unicode arrays plus a null mask.
+    """
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    log.info('building feature cache for {} in {}...'.format(csv_path, cache_dir))
+    signature = source_signature(csv_path)
+    df = pd.read_csv(csv_path)
+
+    tmp_dir = '{}.tmp-{}'.format(cache_dir.rstrip(os.sep), os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for position, col in enumerate(df.columns):
+        numeric = df[col].dtype.kind in 'biufcmM'
+        columns.append({'name': col,
+                        'file': _column_file(position),
+                        'dtype': str(df[col].dtype),
+                        'numeric': bool(numeric),
+                        'mask': None})
+
+    groups = df.groupby('ticker', sort=False).indices
+    tickers = {}
+    for ticker, rows in groups.items():
+        ticker = str(ticker)
+        ticker_dir = os.path.join(tmp_dir, ticker)
+        os.makedirs(ticker_dir)
+        np.save(os.path.join(ticker_dir, INDEX_FILE),
+                df.index.values[rows].astype(np.int64))
+        for position, col in enumerate(df.columns):
+            values = df[col].values[rows]
+            if columns[position]['numeric']:
+                np.save(os.path.join(ticker_dir, _column_file(position)),
+                        np.ascontiguousarray(values))
+                continue
+            mask = pd.isna(values)
+            if mask.any():
+                np.save(os.path.join(ticker_dir, _mask_file(position)), mask)
+                columns[position]['mask'] = _mask_file(position)
+            np.save(os.path.join(ticker_dir, _column_file(position)),
+                    np.where(mask, '', values).astype(str))
+        tickers[ticker] = len(rows)
+
+    manifest = {'version': VERSION,
+                'source': signature,
+                'rows': len(df),
+                'columns': columns,
+                'tickers': tickers}
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    log.info('cached {} tickers, {} columns'.format(len(tickers), len(columns)))
+    return manifest
+
+
+def ensure_cache(csv_path, cache_dir=None):
+    """Returns the manifest of an up-to-date cache, (re)building it if needed"""
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    if not is_fresh(csv_path, cache_dir):
+        return build_cache(csv_path, cache_dir)
+    return read_manifest(cache_dir)
+
+
+def load_ticker(cache_dir, ticker, columns=None, manifest=None):
+    """Reads the rows of one ticker, restricted to columns, as a DataFrame
+
+    The frame has the same column order, dtypes and (CSV row number) index as
+    ``df[df['ticker'] == ticker][columns]`` on the source CSV.
+    """
+    manifest = manifest or read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError('no feature cache in {}'.format(cache_dir))
+    if ticker not in manifest['tickers']:
+        raise KeyError('ticker {} not in feature cache'.format(ticker))
+
+    specs = {spec['name']: spec for spec in manifest['columns']}
+    if columns is None:
+        columns = list(specs)
+    ticker_dir = os.path.join(cache_dir, ticker)
+
+    data = {}
+    for col in columns:
+        spec = specs[col]
+        values = np.load(os.path.join(ticker_dir, spec['file']))
+        if not spec['numeric']:
+            values = values.astype(object)
+            if spec['mask'] is not None:
+                values[np.load(os.path.join(ticker_dir, spec['mask']))] = np.nan
+            values = pd.array(values, dtype=spec['dtype'])
+        data[col] = values
+    # index through the CSV's RangeIndex so it has the type df[mask] would give
+    index = pd.RangeIndex(manifest['rows'])[np.load(os.path.join(ticker_dir, INDEX_FILE))]
+    return pd.DataFrame(data, index=index, columns=list(columns))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else '../nasdaq100_stock_prices_plus_features.csv'
+    build_cache(csv_path, sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,296 @@
+"""
+Out-of-core, chunked feature files for long (e.g. intraday) histories
+
+DataSource holds the whole preprocessed history of a ticker in a DataFrame,
+which does not scale to minute bars. build() instead streams the feature CSV
+in chunks of read_rows rows and writes, per ticker, the unscaled features
+(DataSource.compute_features, 'returns' first) as a sequence of .npy part
+files. The scaler mean/std and the min/max of every column are accumulated in
+the same pass and stored in the ticker's manifest:
+
+    out_dir/<ticker>/manifest.json       columns, part rows, mean, scale, min, max
+    out_dir/<ticker>/part-00000.npy      (rows, n_features) features
+    out_dir/<ticker>/dates-00000.npy     datetime64[ns] dates of those rows
+
+ChunkedDataSource reads such a directory: reset() memory-maps only the parts
+covering the new episode, copies its rows into a preallocated page and
+scales them, so resident memory depends on trading_days (and window), not on
+the length of the history. Observations equal those of DataSource up to
+floating-point rounding of the streamed scaler statistics.
+
+    python feature_chunks.py data/minute_bars_plus_features.csv data/minute_chunks
+    env = TradingEnvironment(ticker='ADBE', chunk_dir='data/minute_chunks')
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from trading_env import DataSource, sliding_windows
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+VERSION = 1
+READ_ROWS = 500000
+# rows of raw history a feature row depends on (pct_change(21))
+CONTEXT_ROWS = 21
+
+
+def _part_file(kind, position):
+    return '{}-{:05d}.npy'.format(kind, position)
+
+
+class _TickerWriter:
+    """Writes the feature parts of one ticker and accumulates its statistics"""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.columns = None
+        self.context = None
+        self.rows = []
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, raw, dates):
+        """Adds the next raw rows (feature_columns order) of the ticker"""
+        context = self.context
+        if context is not None:
+            raw = pd.concat([context, raw])
+        features = DataSource.compute_features(raw)
+        if context is not None:
+            features = features[~features.index.isin(context.index)]
+        self.context = raw.iloc[-CONTEXT_ROWS:]
+        if self.columns is None:
+            self.columns = ['returns'] + list(features.columns.drop('returns'))
+        if not len(features):
+            return
+        values = features[self.columns].values.astype(np.float64)
+        self._update_statistics(values)
+        position = len(self.rows)
+        np.save(os.path.join(self.path, _part_file('part', position)),
+                np.ascontiguousarray(values, dtype=self.dtype))
+        np.save(os.path.join(self.path, _part_file('dates', position)),
+                pd.to_datetime(dates.loc[features.index]).values.astype('datetime64[ns]'))
+        self.rows.append(len(values))
+
+    def _update_statistics(self, values):
+        """Chan et al.'s parallel update of count, mean and squared deviations"""
+        n = len(values)
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        if not self.count:
+            self.mean, self.m2 = mean, m2
+            self.min, self.max = values.min(axis=0), values.max(axis=0)
+        else:
+            total = self.count + n
+            delta = mean - self.mean
+            self.mean = self.mean + delta * n / total
+            self.m2 = self.m2 + m2 + delta ** 2 * self.count * n / total
+            self.min = np.minimum(self.min, values.min(axis=0))
+            self.max = np.maximum(self.max, values.max(axis=0))
+        self.count += n
+
+    def close(self):
+        """Writes and returns the manifest"""
+        if not self.count:
+            raise ValueError('no complete feature rows for {}'.format(self.path))
+        scale = np.sqrt(self.m2 / self.count)
+        # as sklearn.preprocessing.scale: constant columns are only centered
+        scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+        manifest = {'version': VERSION,
+                    'columns': self.columns,
+                    'dtype': np.dtype(self.dtype).str,
+                    'rows': self.rows,
+                    'n_rows': self.count,
+                    'mean': self.mean.tolist(),
+                    'scale': scale.tolist(),
+                    'min': self.min.tolist(),
+                    'max': self.max.tolist()}
+        with open(os.path.join(self.path, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        return manifest
+
+
+def build(data_path, out_dir, tickers=None, read_rows=READ_ROWS, dtype=np.float64):
+    """Streams data_path into per-ticker feature parts in out_dir; returns
+    {ticker: manifest}. Rows of a ticker must be sorted by date"""
+    header = pd.read_csv(data_path, nrows=0).columns
+    raw_columns = DataSource.feature_columns(header)
+    writers = {}
+    started = time.perf_counter()
+    for chunk in pd.read_csv(data_path, usecols=['date', 'ticker'] + raw_columns, chunksize=read_rows):
+        for ticker, rows in chunk.groupby('ticker', sort=False):
+            if tickers is not None and ticker not in tickers:
+                continue
+            writer = writers.get(ticker)
+            if writer is None:
+                writer = writers[ticker] = _TickerWriter(os.path.join(out_dir, ticker), dtype)
+            writer.append(rows[raw_columns], rows['date'])
+    manifests = {ticker: writer.close() for ticker, writer in writers.items()}
+    log.info('wrote {} tickers, {} feature rows in {:.1f}s'.format(
+        len(manifests), sum(m['n_rows'] for m in manifests.values()), time.perf_counter() - started))
+    return manifests
+
+
+class ChunkedFeatures:
+    """Row-range reads from the feature parts of one ticker"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != VERSION:
+            raise ValueError('unsupported chunk version in {}'.format(path))
+        self.manifest = manifest
+        self.columns = manifest['columns']
+        self.n_rows = manifest['n_rows']
+        self.starts = np.r_[0, np.cumsum(manifest['rows'])]
+        self.mean = np.array(manifest['mean'])
+        self.scale = np.array(manifest['scale'])
+        # (data offset in file, rows) of every part, so reads skip the header parsing
+        self.parts = []
+        for position, rows in enumerate(manifest['rows']):
+            part = np.load(os.path.join(path, _part_file('part', position)), mmap_mode='r')
+            self.parts.append((part.offset, rows))
+            del part
+        self.dtype = np.dtype(manifest['dtype'])
+
+    def read(self, start, stop, out):
+        """Copies rows [start, stop) into out; only the parts covering them
+        are mapped, and unmapped again afterwards"""
+        first = int(np.searchsorted(self.starts, start, side='right')) - 1
+        written = 0
+        for position in range(first, len(self.parts)):
+            part_start = self.starts[position]
+            if part_start >= stop:
+                break
+            offset, rows = self.parts[position]
+            part = np.memmap(os.path.join(self.path, _part_file('part', position)), dtype=self.dtype,
+                             mode='r', offset=offset, shape=(rows, len(self.columns)))
+            lo, hi = max(start - part_start, 0), min(stop - part_start, rows)
+            out[written:written + hi - lo] = part[lo:hi]
+            written += hi - lo
+            del part
+        return out
+
+    def scale_rows(self, values):
+        """Standardizes all columns but 'returns' (column 0) in place"""
+        values[:, 1:] -= self.mean[1:]
+        values[:, 1:] /= self.scale[1:]
+        return values
+
+    def bounds(self, normalize=True):
+        """Returns the (min, max) of every column as seen by a DataSource"""
+        low, high = np.array(self.manifest['min']), np.array(self.manifest['max'])
+        if normalize:
+            low[1:] = (low[1:] - self.mean[1:]) / self.scale[1:]
+            high[1:] = (high[1:] - self.mean[1:]) / self.scale[1:]
+        return low, high
+
+    def dates(self):
+        """Returns the dates of all rows (loads the whole date column)"""
+        return np.concatenate([np.load(os.path.join(self.path, _part_file('dates', position)))
+                               for position in range(len(self.parts))])
+
+
+class ChunkedDataSource(DataSource):
+    """DataSource paging episodes in from chunk_dir (see build())
+
+    Only the rows of the current episode (plus window - 1 rows before it) are
+    held in memory; self.data is None. Every episode is paged into a new
+    array, so observations returned earlier (views of their episode's page)
+    never change.
+    """
+
+    def __init__(self, trading_days=252, ticker='ADBE', normalize=True, chunk_dir=None,
+                 metrics=None, window=None):
+        self.ticker = ticker
+        self.trading_days = trading_days
+        self.normalize = normalize
+        self.chunk_dir = chunk_dir
+        self.metrics = metrics
+        if self.metrics is not None:
+            self._data_phase = self.metrics.histogram('env_step_seconds', phase='data')
+        self.chunks = ChunkedFeatures(os.path.join(chunk_dir, ticker))
+        self.data = None
+        self.min_values, self.max_values = self.chunks.bounds(normalize)
+        self.window = window
+        # rows offset - context .. offset + trading_days
+        self.context = 0 if window is None else window - 1
+        self.page = None
+        self.page_returns = None
+        self.step = 0
+        self.offset = None
+        self.np_random = None
+
+    def __len__(self):
+        return self.chunks.n_rows
+
+    def reset(self):
+        """Draws the episode offset and pages its rows in"""
+        super().reset()
+        rows = np.empty((self.context + self.trading_days + 1, len(self.chunks.columns)))
+        self.chunks.read(self.offset - self.context, self.offset + self.trading_days + 1, rows)
+        if self.normalize:
+            self.chunks.scale_rows(rows)
+        self.page_returns = rows[:, 0]
+        if self.window is None:
+            self.page = rows
+        else:
+            self.page = rows.astype(np.float32)
+            self.windows = sliding_windows(self.page, self.window)
+
+    def take_step(self):
+        """Returns data for current trading day and done signal"""
+        if self.metrics is not None:
+            started = time.perf_counter()
+        if self.window is None:
+            obs = self.page[self.step]
+        else:
+            obs = self.windows[self.step]
+        self.step += 1
+        done = self.step > self.trading_days
+        if self.metrics is not None:
+            self._data_phase.observe(time.perf_counter() - started)
+        return obs, done
+
+    def market_return(self):
+        return self.page_returns[self.context + self.step - 1]
+
+    def window_batch(self, rows):
+        """Returns the (len(rows), window, n_features) windows ending at rows,
+        read from the chunk files (without a window, the (len(rows),
+        n_features) rows themselves)"""
+        rows = np.asarray(rows)
+        window = 1 if self.window is None else self.window
+        batch = np.empty((len(rows), window, len(self.chunks.columns)))
+        for i, row in enumerate(rows):
+            self.chunks.read(row - window + 1, row + 1, batch[i])
+            if self.normalize:
+                self.chunks.scale_rows(batch[i])
+        if self.window is None:
+            batch = batch[:, 0]
+        return batch.astype(np.float32)
+
+    def load_dates(self):
+        return pd.DatetimeIndex(self.chunks.dates())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Writes chunked feature files for ChunkedDataSource')
+    parser.add_argument('data_path')
+    parser.add_argument('out_dir')
+    parser.add_argument('--tickers', nargs='*')
+    parser.add_argument('--read-rows', type=int, default=READ_ROWS)
+    parser.add_argument('--float32', action='store_true', help='store features as float32')
+    args = parser.parse_args()
+    build(args.data_path, args.out_dir, tickers=args.tickers, read_rows=args.read_rows,
+          dtype=np.float32 if args.float32 else np.float64)
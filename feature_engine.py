@@ -0,0 +1,193 @@
+"""
+Incremental feature engine
+
+Computes the observation rows of DataSource (the return features of
+preprocess.ipynb plus the returns/ret_* columns and scaling added by
+DataSource.preprocess_data) one appended daily bar at a time, instead of
+recomputing them over the full history.
+
+Per ticker, only the state needed for the next row is kept:
+
+- a ring buffer of the last 64 closes for pct_change over up to 63 days,
+- a ring buffer of the last 21 dollar volumes for dollar_vol_1m,
+- ring buffers of return_{lag}d for the return_{lag}d_lag{t} shifts,
+- running mean/variance of every feature for the scaler.
+
+The quantile clip bounds of return_{lag}d are global (they are computed over
+all tickers and the whole history in the notebook), so they are computed once
+with clip_bounds() and passed in. dollar_vol_rank is cross-sectional;
+IncrementalFeatureEngine.append_day ranks the tickers appended for a date.
+"""
+
+import numpy as np
+import pandas as pd
+
+LAGS = [1, 5, 10, 21, 42, 63]
+SHIFTED_LAGS = [1, 5, 10, 21]
+SHIFTS = [1, 2, 3, 4, 5]
+RET_PERIODS = [2, 5, 10, 21]
+QUANTILE = 0.0001
+DOLLAR_VOL_WINDOW = 21
+
+# raw columns kept by DataSource, in file order, minus close/high/low/volume
+RAW_COLUMNS = (['open', 'month', 'dollar_vol', 'dollar_vol_1m', 'dollar_vol_rank'] +
+               ['return_{}d'.format(lag) for lag in LAGS] +
+               ['return_{}d_lag{}'.format(lag, t) for t in SHIFTS for lag in SHIFTED_LAGS])
+# observation columns of DataSource.data
+FEATURE_COLUMNS = (['returns'] + RAW_COLUMNS +
+                   ['ret_{}'.format(period) for period in RET_PERIODS])
+
+
+def clip_bounds(price_df, q=QUANTILE):
+    """Returns {lag: (lower, upper)} as used for return_{lag}d in the notebook"""
+    close = price_df.groupby('ticker').close
+    bounds = {}
+    for lag in LAGS:
+        returns = close.pct_change(lag)
+        bounds[lag] = (returns.quantile(q), returns.quantile(1 - q))
+    return bounds
+
+
+class RingBuffer:
+    """Fixed-size float history; ago(k) is the value appended k appends ago"""
+
+    def __init__(self, size):
+        self.values = np.full(size, np.nan)
+        self.size = size
+        self.pos = -1
+        self.count = 0
+
+    def append(self, value):
+        self.pos = (self.pos + 1) % self.size
+        self.values[self.pos] = value
+        self.count += 1
+
+    def ago(self, k):
+        if k >= self.count or k >= self.size:
+            return np.nan
+        return self.values[(self.pos - k) % self.size]
+
+
+class RunningScaler:
+    """Running mean and population std (as sklearn.preprocessing.scale)"""
+
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, row):
+        self.count += 1
+        delta = row - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (row - self.mean)
+
+    @property
+    def std(self):
+        std = np.sqrt(self.m2 / max(self.count, 1))
+        std[std == 0] = 1  # as sklearn: leave constant features unscaled
+        return std
+
+    def transform(self, row):
+        return (row - self.mean) / self.std
+
+
+class TickerFeatureState:
+    """Rolling state of one ticker; emits one observation row per bar
+
+    Rows are emitted in FEATURE_COLUMNS order. Rows with missing or infinite
+    values, which DataSource drops, are returned as None and do not update the
+    scaler. With normalize=True, every column but 'returns' is scaled with the
+    running statistics including the new row, which equals the last row of
+    DataSource's batch scaling over the same history.
+    """
+
+    def __init__(self, bounds, normalize=True):
+        self.bounds = bounds
+        self.normalize = normalize
+        self.closes = RingBuffer(max(LAGS + RET_PERIODS) + 1)
+        self.dollar_vols = RingBuffer(DOLLAR_VOL_WINDOW)
+        self.lagged_returns = {lag: RingBuffer(max(SHIFTS) * lag + 1)
+                               for lag in SHIFTED_LAGS}
+        self.scaler = RunningScaler(len(FEATURE_COLUMNS) - 1)
+        self._pending = None
+
+    def _pct_change(self, periods):
+        return self.closes.ago(0) / self.closes.ago(periods) - 1
+
+    def push_bar(self, date, open, close, volume):
+        """Adds a bar; returns its dollar_vol_1m (needed for ranking)"""
+        self.closes.append(close)
+        self.dollar_vols.append(np.nanprod([close, volume]))
+        window = self.dollar_vols.values if self.dollar_vols.count >= DOLLAR_VOL_WINDOW \
+            else self.dollar_vols.values[:self.dollar_vols.count]
+        dollar_vol_1m = np.nanmean(window) if not np.isnan(window).all() else np.nan
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = {}
+            for lag in LAGS:
+                lower, upper = self.bounds[lag]
+                clipped = min(max(self._pct_change(lag), lower), upper)
+                returns[lag] = np.power(clipped + 1, 1 / lag) - 1
+            for lag in SHIFTED_LAGS:
+                self.lagged_returns[lag].append(returns[lag])
+            lagged = [self.lagged_returns[lag].ago(t * lag)
+                      for t in SHIFTS for lag in SHIFTED_LAGS]
+            ret = [self._pct_change(period) for period in [1] + RET_PERIODS]
+
+        self._pending = ([open, pd.Timestamp(date).month, self.dollar_vols.ago(0), dollar_vol_1m],
+                         [returns[lag] for lag in LAGS] + lagged, ret)
+        return dollar_vol_1m
+
+    def emit(self, dollar_vol_rank):
+        """Completes the pushed bar with its rank; returns the row or None"""
+        head, tail, ret = self._pending
+        self._pending = None
+        row = np.array([ret[0]] + head + [dollar_vol_rank] + tail + ret[1:], dtype=np.float64)
+        if not np.isfinite(row).all():
+            return None
+        features = row[1:]
+        self.scaler.update(features)
+        if self.normalize:
+            row[1:] = self.scaler.transform(features)
+        return row
+
+    def append(self, date, open, close, volume, dollar_vol_rank):
+        """Adds a bar whose dollar_vol_rank is known; returns the row or None"""
+        self.push_bar(date, open, close, volume)
+        return self.emit(dollar_vol_rank)
+
+
+class IncrementalFeatureEngine:
+    """Keeps a TickerFeatureState per ticker and ranks dollar volume per day"""
+
+    def __init__(self, bounds, normalize=True):
+        self.bounds = bounds
+        self.normalize = normalize
+        self.states = {}
+
+    def state(self, ticker):
+        if ticker not in self.states:
+            self.states[ticker] = TickerFeatureState(self.bounds, self.normalize)
+        return self.states[ticker]
+
+    def append_day(self, date, bars):
+        """Appends one day of bars for several tickers
+
+        bars is a DataFrame indexed by ticker with open, close and volume
+        columns. Returns {ticker: observation row or None}.
+        """
+        dollar_vol_1m = pd.Series([self.state(ticker).push_bar(date, open, close, volume)
+                                   for ticker, open, close, volume
+                                   in zip(bars.index, bars.open.values,
+                                          bars.close.values, bars.volume.values)],
+                                  index=bars.index)
+        ranks = dollar_vol_1m.rank(ascending=False)
+        return {ticker: self.states[ticker].emit(rank) for ticker, rank in ranks.items()}
+
+    def warm_up(self, price_df):
+        """Replays a long-format price history (date, ticker, open, close, volume)"""
+        last = {}
+        for date, bars in price_df.sort_values('date').groupby('date', sort=False):
+            last.update(self.append_day(date, bars.set_index('ticker')))
+        return last
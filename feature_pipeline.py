@@ -0,0 +1,268 @@
+"""
+Parallel, chunked rebuild of the feature dataset of preprocess.ipynb
+
+Produces the columns of nasdaq100_stock_prices_plus_features.csv from
+nasdaq100_stock_prices.csv without holding the whole table in memory:
+
+1. split: the price CSV is streamed in chunks into per-ticker pieces
+2. local: per ticker, in a process pool: dollar_vol, dollar_vol_1m and the
+   unclipped pct_change(lag) columns
+3. global: a pass over just the columns needed for the cross-sectional
+   steps: the quantile clip bounds of every pct_change(lag) and the per-date
+   dollar_vol_rank
+4. finish: per ticker, in a process pool: the clipped return_{lag}d, the lag
+   shifts, targets, year and month, written as one CSV partition per ticker
+
+Each worker holds one ticker at a time. The partitions keep the row labels of
+the price CSV, so combine() concatenates them into the single CSV the
+notebook writes.
+
+    python feature_pipeline.py data/nasdaq100_stock_prices.csv data/features \\
+        --workers 4 --combine data/nasdaq100_stock_prices_plus_features.csv
+    python feature_pipeline.py data/nasdaq100_stock_prices.csv /tmp/check --verify 5
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_engine import LAGS, QUANTILE, SHIFTED_LAGS, SHIFTS
+
+log = logging.getLogger(__name__)
+
+TARGETS = [1, 5, 10, 21]
+CHUNK_ROWS = 200000
+MANIFEST = '_manifest.json'
+WORK_DIR = '_work'
+
+
+def notebook_features(price_df):
+    """The feature steps of preprocess.ipynb, unchanged (reference
+    implementation, builds everything in memory)"""
+    price_df = price_df.copy()
+    price_df['dollar_vol'] = price_df[['close', 'volume']].prod(axis=1)
+    price_df['dollar_vol_1m'] = (price_df.groupby('ticker')['dollar_vol']
+                                 .rolling(window=21, min_periods=1)
+                                 .mean()
+                                 .reset_index(level=0, drop=True))
+    price_df['dollar_vol_rank'] = (price_df.groupby(price_df['date'])
+                                   .dollar_vol_1m
+                                   .rank(ascending=False))
+    q = QUANTILE
+    for lag in LAGS:
+        price_df[f'return_{lag}d'] = (price_df.groupby('ticker').close
+                                      .pct_change(lag)
+                                      .pipe(lambda x: x.clip(lower=x.quantile(q),
+                                                             upper=x.quantile(1 - q)))
+                                      .add(1)
+                                      .pow(1 / lag)
+                                      .sub(1))
+    for t in SHIFTS:
+        for lag in SHIFTED_LAGS:
+            price_df[f'return_{lag}d_lag{t}'] = (price_df.groupby('ticker')
+                                                 [f'return_{lag}d'].shift(t * lag))
+    for t in TARGETS:
+        price_df[f'target_{t}d'] = price_df.groupby('ticker')[f'return_{t}d'].shift(1)
+    price_df['year'] = price_df['date'].dt.year
+    price_df['month'] = price_df['date'].dt.month
+    return price_df
+
+
+def read_prices(path, **kwargs):
+    """Reads the price CSV as the notebook does (row labels from its index column)"""
+    return pd.read_csv(path, index_col=0, parse_dates=['date'], **kwargs)
+
+
+def _ticker_dir(work_dir, stage, ticker):
+    return os.path.join(work_dir, stage, ticker)
+
+
+def split(prices_path, work_dir, chunk_rows=CHUNK_ROWS):
+    """Streams the price CSV into per-ticker pieces; returns the tickers in
+    file order"""
+    tickers = {}
+    for n, chunk in enumerate(read_prices(prices_path, chunksize=chunk_rows)):
+        for ticker, rows in chunk.groupby('ticker', sort=False):
+            ticker_dir = _ticker_dir(work_dir, 'raw', ticker)
+            os.makedirs(ticker_dir, exist_ok=True)
+            rows.to_pickle(os.path.join(ticker_dir, '{:06d}.pkl'.format(n)))
+            tickers.setdefault(ticker, 0)
+            tickers[ticker] += len(rows)
+    return tickers
+
+
+def _load_raw(work_dir, ticker):
+    ticker_dir = _ticker_dir(work_dir, 'raw', ticker)
+    return pd.concat([pd.read_pickle(os.path.join(ticker_dir, name))
+                      for name in sorted(os.listdir(ticker_dir))])
+
+
+def local_features(work_dir, ticker):
+    """Per-ticker columns that need no other ticker, saved as .npy columns"""
+    df = _load_raw(work_dir, ticker)
+    out_dir = _ticker_dir(work_dir, 'local', ticker)
+    os.makedirs(out_dir, exist_ok=True)
+    dollar_vol = df[['close', 'volume']].prod(axis=1)
+    columns = {'dollar_vol': dollar_vol,
+               'dollar_vol_1m': dollar_vol.rolling(window=21, min_periods=1).mean(),
+               'date': df['date']}
+    for lag in LAGS:
+        columns['pct_change_{}'.format(lag)] = df['close'].pct_change(lag)
+    for name, values in columns.items():
+        np.save(os.path.join(out_dir, name + '.npy'), values.values)
+    return ticker
+
+
+def _load_local(work_dir, ticker, name):
+    return np.load(os.path.join(_ticker_dir(work_dir, 'local', ticker), name + '.npy'),
+                   mmap_mode='r')
+
+
+def global_statistics(work_dir, tickers, q=QUANTILE):
+    """Computes the clip bounds {lag: (lower, upper)} and writes the per-date
+    dollar_vol_rank of every ticker; reads one column at a time"""
+    bounds = {}
+    for lag in LAGS:
+        values = pd.Series(np.concatenate([_load_local(work_dir, t, 'pct_change_{}'.format(lag))
+                                           for t in tickers]))
+        bounds[lag] = (float(values.quantile(q)), float(values.quantile(1 - q)))
+        del values
+
+    lengths = [len(_load_local(work_dir, t, 'date')) for t in tickers]
+    volume = pd.DataFrame({'date': np.concatenate([_load_local(work_dir, t, 'date') for t in tickers]),
+                           'dollar_vol_1m': np.concatenate([_load_local(work_dir, t, 'dollar_vol_1m')
+                                                            for t in tickers])})
+    ranks = volume.groupby('date').dollar_vol_1m.rank(ascending=False).values
+    for ticker, part in zip(tickers, np.split(ranks, np.cumsum(lengths)[:-1])):
+        np.save(os.path.join(_ticker_dir(work_dir, 'local', ticker), 'dollar_vol_rank.npy'), part)
+    return bounds
+
+
+def finish_features(work_dir, out_dir, ticker, bounds):
+    """Writes the feature partition of ticker; returns its row count"""
+    df = _load_raw(work_dir, ticker)
+    for name in ('dollar_vol', 'dollar_vol_1m', 'dollar_vol_rank'):
+        df[name] = np.asarray(_load_local(work_dir, ticker, name))
+    for lag in LAGS:
+        lower, upper = bounds[lag]
+        df[f'return_{lag}d'] = (pd.Series(np.asarray(_load_local(work_dir, ticker, 'pct_change_{}'.format(lag))),
+                                          index=df.index)
+                                .clip(lower=lower, upper=upper)
+                                .add(1)
+                                .pow(1 / lag)
+                                .sub(1))
+    for t in SHIFTS:
+        for lag in SHIFTED_LAGS:
+            df[f'return_{lag}d_lag{t}'] = df[f'return_{lag}d'].shift(t * lag)
+    for t in TARGETS:
+        df[f'target_{t}d'] = df[f'return_{t}d'].shift(1)
+    df['year'] = df['date'].dt.year
+    df['month'] = df['date'].dt.month
+    df.to_csv(os.path.join(out_dir, '{}.csv'.format(ticker)))
+    return len(df)
+
+
+def run(prices_path, out_dir, workers=None, chunk_rows=CHUNK_ROWS):
+    """Builds the feature partitions of prices_path in out_dir; returns the
+    manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    work_dir = os.path.join(out_dir, WORK_DIR)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    try:
+        log.info('splitting {}...'.format(prices_path))
+        tickers = list(split(prices_path, work_dir, chunk_rows))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            log.info('local features of {} tickers...'.format(len(tickers)))
+            list(pool.map(local_features, [work_dir] * len(tickers), tickers))
+            log.info('clip bounds and dollar volume ranks...')
+            bounds = global_statistics(work_dir, tickers)
+            log.info('finishing partitions...')
+            rows = list(pool.map(finish_features, [work_dir] * len(tickers),
+                                 [out_dir] * len(tickers), tickers, [bounds] * len(tickers)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    manifest = {'source': os.path.abspath(prices_path),
+                'tickers': dict(zip(tickers, rows)),
+                'clip_bounds': {str(lag): list(b) for lag, b in bounds.items()}}
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def combine(out_dir, csv_path):
+    """Concatenates the partitions (in price file order) into one CSV laid
+    out like the notebook's nasdaq100_stock_prices_plus_features.csv"""
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        tickers = json.load(f)['tickers']
+    with open(csv_path, 'w') as out:
+        for n, ticker in enumerate(tickers):
+            with open(os.path.join(out_dir, '{}.csv'.format(ticker))) as part:
+                header = part.readline()
+                if n == 0:
+                    out.write(header)
+                shutil.copyfileobj(part, out)
+
+
+def verify(prices_path, n_tickers=5, workers=None, seed=0, atol=1e-12):
+    """Runs the pipeline and the notebook code on a sample of tickers and
+    compares every column; returns {column: max abs difference} (the clip
+    bounds of both come from the sample)"""
+    prices = read_prices(prices_path)
+    tickers = prices['ticker'].unique()
+    sample = np.random.default_rng(seed).choice(tickers, min(n_tickers, len(tickers)), replace=False)
+    prices = prices[prices['ticker'].isin(sample)]
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_path = os.path.join(tmp, 'prices.csv')
+        prices.to_csv(sample_path)
+        expected = notebook_features(read_prices(sample_path))
+        run(sample_path, os.path.join(tmp, 'out'), workers=workers)
+        combine(os.path.join(tmp, 'out'), os.path.join(tmp, 'features.csv'))
+        actual = pd.read_csv(os.path.join(tmp, 'features.csv'), index_col=0, parse_dates=['date'])
+    expected = pd.read_csv(io.StringIO(expected.to_csv()), index_col=0, parse_dates=['date'])
+
+    if list(actual.columns) != list(expected.columns) or not actual.index.equals(expected.index):
+        raise AssertionError('columns or rows differ from the notebook output')
+    differences = {}
+    for col in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[col]):
+            a, e = actual[col].values.astype(float), expected[col].values.astype(float)
+            if not np.array_equal(np.isnan(a), np.isnan(e)):
+                raise AssertionError('missing values of {} differ'.format(col))
+            differences[col] = float(np.nanmax(np.abs(a - e), initial=0))
+        elif not actual[col].equals(expected[col]):
+            raise AssertionError('{} differs'.format(col))
+    worst = max(differences.values(), default=0)
+    if worst > atol:
+        raise AssertionError('max abs difference {} exceeds {}'.format(worst, atol))
+    return differences
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Builds the feature dataset of preprocess.ipynb')
+    parser.add_argument('prices', help='nasdaq100_stock_prices.csv')
+    parser.add_argument('out_dir', help='directory of the per-ticker partitions')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--combine', metavar='CSV', help='also write the single feature CSV')
+    parser.add_argument('--verify', type=int, metavar='N',
+                        help='only compare with the notebook on N sample tickers')
+    args = parser.parse_args()
+
+    if args.verify:
+        differences = verify(args.prices, args.verify, args.workers)
+        log.info('matches the notebook (max abs difference {:.3g})'.format(max(differences.values())))
+    else:
+        manifest = run(args.prices, args.out_dir, args.workers, args.chunk_rows)
+        log.info('wrote {} partitions to {}'.format(len(manifest['tickers']), args.out_dir))
+        if args.combine:
+            combine(args.out_dir, args.combine)
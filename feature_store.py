@@ -0,0 +1,199 @@
+"""
+Process-wide and cross-process store of preprocessed ticker features
+
+Each DataSource normally loads and preprocesses its own copy of a ticker's
+features. A FeatureStore preprocesses each ticker once into a read-only
+float64 array and hands out zero-copy DataFrames over it:
+
+- within a process, every DataSource built with the same store shares one
+  array per ticker;
+- with shared=True the array lives in a named shared memory segment, so
+  other processes that open a FeatureStore with the same prefix and source
+  CSV attach to it instead of loading the data again.
+
+Segment names include a hash of the source CSV's path, size and mtime, so
+stores over different (versions of) data never attach to each other's
+segments; the full signature is also checked on attach.
+
+The process that first publishes a ticker owns its segment and removes it on
+unlink(); attaching processes only close() their mapping.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+import feature_cache
+from trading_env import CACHE_DIR, DATA_PATH, DataSource
+
+log = logging.getLogger(__name__)
+
+MAGIC = 0x31544145464c5744  # b'DLWFEAT1'
+HEADER_SIZE = 64
+ALIGN = 64
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def attach_segment(name):
+    """Opens an existing segment without registering it with the resource
+    tracker, which would otherwise remove it when this process exits"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # python >= 3.13
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+class FeatureStore:
+    """Read-only preprocessed features per ticker, shared by all DataSources"""
+
+    def __init__(self, prefix='dlweek', shared=True,
+                 data_path=DATA_PATH, cache_dir=CACHE_DIR, timeout=60):
+        self.prefix = prefix
+        self.shared = shared
+        self.data_path = data_path
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self._frames = {}
+        self._segments = {}
+        self._owned = set()
+        self._source = None
+
+    @property
+    def source(self):
+        """Signature (path, size, mtime) of data_path, taken on first use"""
+        if self._source is None:
+            self._source = feature_cache.source_signature(self.data_path)
+        return self._source
+
+    def segment_name(self, ticker, normalize=True):
+        digest = hashlib.sha1(json.dumps(self.source, sort_keys=True).encode()).hexdigest()[:8]
+        return '{}_{}_n{:d}_{}'.format(self.prefix, ticker, normalize, digest)
+
+    def frame(self, ticker, normalize=True):
+        """Returns the preprocessed features of ticker as a read-only DataFrame
+
+        The frame is a view over the store's array; nothing is copied after
+        the first call for a ticker in this process.
+        """
+        key = (ticker, bool(normalize))
+        if key not in self._frames:
+            values = None
+            if self.shared:
+                values, columns, index = self._attach(ticker, normalize)
+            if values is None:
+                values, columns, index = self._build(ticker, normalize)
+                if self.shared:
+                    values = self._publish(ticker, normalize, values, columns, index)
+            values.setflags(write=False)
+            self._frames[key] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+        return self._frames[key]
+
+    def array(self, ticker, normalize=True):
+        """Returns the preprocessed features of ticker as a read-only 2-D array"""
+        return self.frame(ticker, normalize).values
+
+    def preload(self, tickers, normalize=True):
+        """Preprocesses and publishes tickers so that workers only attach"""
+        for ticker in tickers:
+            self.frame(ticker, normalize)
+
+    def _build(self, ticker, normalize):
+        data = DataSource(ticker=ticker, normalize=normalize,
+                          data_path=self.data_path, cache_dir=self.cache_dir).data
+        values = np.ascontiguousarray(data.values, dtype=np.float64)
+        return values, list(data.columns), data.index
+
+    def _publish(self, ticker, normalize, values, columns, index):
+        """Copies values into a new shared memory segment; returns the view"""
+        meta = json.dumps({'columns': columns, 'source': self.source}).encode()
+        rows, cols = values.shape
+        data_offset = _aligned(HEADER_SIZE + len(meta))
+        index_offset = data_offset + _aligned(values.nbytes)
+        size = index_offset + rows * 8
+        try:
+            shm = shared_memory.SharedMemory(self.segment_name(ticker, normalize),
+                                             create=True, size=size)
+        except FileExistsError:
+            # another process published it first
+            return self._attach(ticker, normalize)[0]
+
+        header = np.ndarray(8, dtype=np.uint64, buffer=shm.buf)
+        header[:] = [MAGIC, 0, len(meta), rows, cols, data_offset, index_offset, size]
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(meta)] = meta
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf, offset=data_offset)
+        shared[:] = values
+        np.ndarray(rows, dtype=np.int64, buffer=shm.buf, offset=index_offset)[:] = index
+        header[1] = 1  # ready
+        self._segments[(ticker, bool(normalize))] = shm
+        self._owned.add((ticker, bool(normalize)))
+        log.info('published {} ({} x {}) to shared memory'.format(ticker, rows, cols))
+        return shared
+
+    def _attach(self, ticker, normalize):
+        """Maps an existing segment; returns (None, None, None) if there is none"""
+        name = self.segment_name(ticker, normalize)
+        try:
+            shm = attach_segment(name)
+        except FileNotFoundError:
+            return None, None, None
+
+        header = np.ndarray(8, dtype=np.uint64, buffer=shm.buf)
+        deadline = time.monotonic() + self.timeout
+        while header[1] != 1:
+            if time.monotonic() > deadline:
+                shm.close()
+                raise TimeoutError('segment {} was never completed'.format(name))
+            time.sleep(0.01)
+        if header[0] != MAGIC:
+            shm.close()
+            raise ValueError('segment {} is not a feature store segment'.format(name))
+
+        meta_len, rows, cols, data_offset, index_offset = (int(v) for v in header[2:7])
+        meta = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + meta_len]))
+        if meta.get('source') != self.source:
+            shm.close()
+            raise ValueError('segment {} was built from {}, not {}'.format(
+                name, meta.get('source'), self.source))
+        values = np.ndarray((rows, cols), dtype=np.float64, buffer=shm.buf, offset=data_offset)
+        index = pd.Index(np.ndarray(rows, dtype=np.int64, buffer=shm.buf, offset=index_offset))
+        self._segments[(ticker, bool(normalize))] = shm
+        return values, meta['columns'], index
+
+    def close(self):
+        """Drops this process' views and mappings (segments stay available)"""
+        self._frames.clear()
+        for shm in self._segments.values():
+            try:
+                shm.close()
+            except BufferError:
+                # a DataSource still holds a view; the mapping goes with the process
+                pass
+        self._segments.clear()
+
+    def unlink(self):
+        """Removes the segments published by this process, then closes"""
+        for key in self._owned:
+            if key in self._segments:
+                self._segments[key].unlink()
+        self._owned.clear()
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
@@ -0,0 +1,158 @@
+"""
+Micro-batching CPU inference service for the trained DDQN model
+
+InferenceService loads the saved Keras model once and serves Q-values and
+greedy actions to any number of callers (the dashboard, environments,
+evaluation code). Requests are queued and a single worker thread coalesces
+them into one model call per batch: a batch is run as soon as it holds
+max_batch_size observations or max_latency_ms after its first request
+arrived, whichever comes first.
+
+    service = InferenceService('ADBE_model.keras')
+    q_values, actions = service.predict(observations)   # blocking
+    future = service.submit(observation)                 # async
+    service.stats()                                      # throughput/latency
+
+Any callable mapping a float32 (n, n_features) batch to (n, 3) Q-values can
+be passed as predict_fn instead of a model path.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MODEL_PATH = 'ADBE_model.keras'
+
+
+def load_keras_model(path=MODEL_PATH):
+    """Loads the saved model; returns a batch -> Q-values function"""
+    import tensorflow as tf
+    model = tf.keras.models.load_model(path, compile=False)
+
+    def predict_fn(batch):
+        return np.asarray(model(batch, training=False))
+    return predict_fn
+
+
+class InferenceService:
+    """Coalesces observation requests into batched model calls"""
+
+    def __init__(self, model_path=MODEL_PATH, max_batch_size=512, max_latency_ms=2.0,
+                 predict_fn=None, latency_window=10000):
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.predict_fn = predict_fn or load_keras_model(model_path)
+        self._requests = queue.Queue()
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._n_requests = 0
+        self._n_observations = 0
+        self._n_batches = 0
+        self._busy = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._serve, name='inference', daemon=True)
+        self._thread.start()
+
+    def submit(self, observations):
+        """Queues one observation (n_features,) or a batch (n, n_features)
+
+        Returns a Future of (q_values, actions) with the same leading shape.
+        """
+        if self._closed:
+            raise RuntimeError('inference service is closed')
+        observations = np.asarray(observations, dtype=np.float32)
+        future = Future()
+        self._requests.put((observations, future, time.perf_counter()))
+        return future
+
+    def predict(self, observations, timeout=None):
+        """Blocking submit(); returns (q_values, actions)"""
+        return self.submit(observations).result(timeout)
+
+    def _collect(self):
+        """Blocks for a first request, then gathers more until the batch is
+        full or the latency budget of the first request is spent"""
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch, size = [first], len(np.atleast_2d(first[0]))
+        deadline = first[2] + self.max_latency
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=timeout) if timeout > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)  # stop after this batch
+                break
+            batch.append(request)
+            size += len(np.atleast_2d(request[0]))
+        return batch
+
+    def _serve(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            inputs = [np.atleast_2d(observations) for observations, _, _ in batch]
+            started = time.perf_counter()
+            try:
+                q_values = np.asarray(self.predict_fn(np.concatenate(inputs)))
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for (observations, future, submitted), rows in zip(batch, inputs):
+                q = q_values[offset:offset + len(rows)]
+                offset += len(rows)
+                if observations.ndim == 1:
+                    q = q[0]
+                future.set_result((q, np.argmax(q, axis=-1)))
+                self._latencies.append(finished - submitted)
+            with self._lock:
+                self._n_requests += len(batch)
+                self._n_observations += offset
+                self._n_batches += 1
+                self._busy += finished - started
+
+    def stats(self):
+        """Returns throughput and latency statistics since start"""
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            latencies = np.array(self._latencies) * 1000
+            stats = {'requests': self._n_requests,
+                     'observations': self._n_observations,
+                     'batches': self._n_batches,
+                     'mean_batch_size': self._n_observations / max(self._n_batches, 1),
+                     'observations_per_sec': self._n_observations / elapsed,
+                     'model_busy_fraction': self._busy / elapsed}
+        if len(latencies):
+            stats.update({'latency_ms_p50': float(np.percentile(latencies, 50)),
+                          'latency_ms_p95': float(np.percentile(latencies, 95)),
+                          'latency_ms_p99': float(np.percentile(latencies, 99))})
+        return stats
+
+    def close(self):
+        """Serves the queued requests, then stops the worker thread"""
+        if not self._closed:
+            self._closed = True
+            self._requests.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
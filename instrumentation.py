@@ -0,0 +1,303 @@
+"""
+Low-overhead instrumentation for the trading environment
+
+A Registry holds histograms, counters and gauges. DataSource,
+TradingSimulator and TradingEnvironment take an optional registry
+(metrics=...) and record into it:
+
+- dlweek_env_step_seconds{phase="assert|data|simulator|total"}
+- dlweek_env_reset_seconds, dlweek_env_steps_total, dlweek_env_resets_total,
+  dlweek_env_episodes_total
+- dlweek_data_seconds{stage="load|preprocess"} and
+  dlweek_data_bytes{stage="load|preprocess"} (memory of the last loaded frame)
+
+Without a registry, the hot paths only test `self.metrics is not None`. The
+global registry is used by default once enabled with enable() or by setting
+DLWEEK_METRICS=1 before the environments are created.
+
+    registry = instrumentation.enable()
+    env = TradingEnvironment(ticker='ADBE')
+    ...
+    registry.snapshot()                       # dict, incl. steps/sec
+    instrumentation.write_json('metrics.json')
+    instrumentation.write_prometheus('metrics.prom')
+    instrumentation.serve(8000)               # http://127.0.0.1:8000/metrics
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PREFIX = 'dlweek_'
+# 100ns .. ~13s, four buckets per decade
+BUCKETS = tuple(10 ** (e / 4) for e in range(-28, 5))
+
+
+class Histogram:
+    """Fixed-bucket histogram of non-negative values (e.g. seconds)"""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = list(bounds)
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating within its bucket"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.max
+                value = lo + (hi - lo) * (rank - seen) / n
+                return min(max(value, self.min), self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count else None,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None,
+                'p50': self.quantile(.5),
+                'p95': self.quantile(.95),
+                'p99': self.quantile(.99)}
+
+
+class Counter:
+    """Monotonic counter"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+
+class Registry:
+    """Histograms, counters and gauges keyed by (name, labels)"""
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self._last = (time.perf_counter(), {})  # for rates between snapshots
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        """Returns the histogram (name, labels), created on first use; hot
+        paths keep the returned object instead of calling observe()"""
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name, **labels):
+        """Returns the counter (name, labels), created on first use"""
+        key = _key(name, labels)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters.setdefault(key, Counter())
+        return counter
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name, value=1, **labels):
+        self.counter(name, **labels).inc(value)
+
+    def set(self, name, value, **labels):
+        self.gauges[_key(name, labels)] = value
+
+    def timer(self, name, **labels):
+        """Context manager observing its duration in seconds"""
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        """Zeroes all metrics; histograms and counters held by environments
+        stay registered"""
+        with self._lock:
+            for histogram in self.histograms.values():
+                histogram.clear()
+            for counter in self.counters.values():
+                counter.value = 0
+            self.gauges.clear()
+            self.started = time.time()
+            self._last = (time.perf_counter(), {})
+
+    def _update_process_gauges(self):
+        if resource is not None:
+            # ru_maxrss is in KiB on Linux
+            self.set('process_max_rss_bytes', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def snapshot(self):
+        """Returns all metrics as a dict; counters include their rate per
+        second since start and since the previous snapshot"""
+        self._update_process_gauges()
+        with self._lock:
+            now = time.perf_counter()
+            last_time, last_counts = self._last
+            uptime = time.time() - self.started
+            counters = {}
+            counts = {key: counter.value for key, counter in list(self.counters.items())}
+            for key, value in counts.items():
+                counters[self.prefix + key[0] + _label_text(key[1])] = {
+                    'value': value,
+                    'per_sec': value / uptime if uptime > 0 else None,
+                    'recent_per_sec': ((value - last_counts.get(key, 0)) / (now - last_time)
+                                       if now > last_time else None)}
+            self._last = (now, counts)
+        return {'time': time.time(),
+                'uptime_seconds': uptime,
+                'histograms': {self.prefix + name + _label_text(labels): h.summary()
+                               for (name, labels), h in list(self.histograms.items())},
+                'counters': counters,
+                'gauges': {self.prefix + name + _label_text(labels): value
+                           for (name, labels), value in list(self.gauges.items())}}
+
+    def prometheus_text(self):
+        """Returns the metrics in the Prometheus text exposition format"""
+        self._update_process_gauges()
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name, labels), counter in sorted(self.counters.items()):
+            header(self.prefix + name, 'counter')
+            lines.append('{}{} {}'.format(self.prefix + name, _label_text(labels), counter.value))
+        for (name, labels), value in sorted(self.gauges.items()):
+            header(self.prefix + name, 'gauge')
+            lines.append('{}{} {}'.format(self.prefix + name, _label_text(labels), value))
+        for (name, labels), h in sorted(self.histograms.items()):
+            name = self.prefix + name
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(h.bounds + ['+Inf'], h.counts):
+                cumulative += n
+                le = bound if bound == '+Inf' else '{:.3g}'.format(bound)
+                lines.append('{}_bucket{} {}'.format(name, _label_text(labels, [('le', le)]), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _label_text(labels), h.sum))
+            lines.append('{}_count{} {}'.format(name, _label_text(labels), h.count))
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry, name, labels):
+        self.registry, self.name, self.labels = registry, name, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+REGISTRY = Registry()
+_enabled = os.environ.get('DLWEEK_METRICS', '').lower() in ('1', 'true', 'yes')
+
+
+def enable():
+    """Makes newly created environments record into the global registry"""
+    global _enabled
+    _enabled = True
+    return REGISTRY
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def default_registry():
+    """Returns the global registry if instrumentation is enabled, else None"""
+    return REGISTRY if _enabled else None
+
+
+def _write(path, text):
+    tmp = '{}.tmp-{}'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json(path, registry=None):
+    """Writes a snapshot of registry (default: the global one) as JSON"""
+    _write(path, json.dumps((registry or REGISTRY).snapshot(), indent=1))
+
+
+def write_prometheus(path, registry=None):
+    """Writes the Prometheus text format, e.g. for node_exporter's textfile collector"""
+    _write(path, (registry or REGISTRY).prometheus_text())
+
+
+def serve(port=8000, registry=None, host='127.0.0.1'):
+    """Serves the Prometheus text format at http://host:port/metrics from a
+    daemon thread; returns the server (call shutdown() to stop it)"""
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
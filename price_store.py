@@ -0,0 +1,63 @@
+"""
+Indexed price store for the dashboard
+
+Holds the price history sorted by (ticker, date) with the [start, stop) row
+offsets of every ticker, so that
+
+- ticker(t) is a dict lookup plus a positional slice,
+- range(t, start, end) is a binary search on that ticker's dates,
+
+and both return views of the stored frame rather than scanning all tickers
+with boolean masks.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class PriceStore:
+    """Price history partitioned by ticker and sorted by date"""
+
+    def __init__(self, price_df):
+        df = price_df.sort_values(['ticker', 'date'], kind='stable').reset_index(drop=True)
+        self.frame = df
+        self.dates = df['date'].values
+        tickers = df['ticker'].values
+        starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]]) if len(df) else []
+        stops = np.r_[starts[1:], len(df)] if len(df) else []
+        self.offsets = {tickers[start]: (int(start), int(stop))
+                        for start, stop in zip(starts, stops)}
+
+    @classmethod
+    def from_csv(cls, path):
+        """Loads a long-format (date, ticker, ...) price CSV"""
+        df = pd.read_csv(path, parse_dates=['date'])
+        # drop the unnamed index column written by to_csv (if it exists)
+        if df.columns[0] == 'Unnamed: 0':
+            df = df.drop(columns=['Unnamed: 0'])
+        return cls(df)
+
+    @property
+    def tickers(self):
+        return list(self.offsets)
+
+    def _date(self, value):
+        return np.datetime64(pd.Timestamp(value)).astype(self.dates.dtype)
+
+    def ticker(self, ticker):
+        """Returns all rows of ticker, sorted by date (empty if unknown)"""
+        start, stop = self.offsets.get(ticker, (0, 0))
+        return self.frame.iloc[start:stop]
+
+    def range(self, ticker, start=None, end=None):
+        """Returns the rows of ticker with start <= date <= end, sorted by date"""
+        first, last = self.offsets.get(ticker, (0, 0))
+        dates = self.dates[first:last]
+        lo = first if start is None else first + int(np.searchsorted(dates, self._date(start), side='left'))
+        hi = last if end is None else first + int(np.searchsorted(dates, self._date(end), side='right'))
+        return self.frame.iloc[lo:max(lo, hi)]
+
+    def last_date(self, ticker):
+        """Returns the latest date of ticker, or None"""
+        start, stop = self.offsets.get(ticker, (0, 0))
+        return pd.Timestamp(self.dates[stop - 1]) if stop > start else None
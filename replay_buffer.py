@@ -0,0 +1,217 @@
+"""
+Compact index-based replay buffers for DDQN training
+
+A transition (s, a, r, s', done) from a TradingEnvironment never needs its
+feature vectors stored: s is a row of the ticker's DataSource.data and s' is
+always the next row. The buffers keep only
+
+    ticker id (int16), row (int32), action (int8), reward (float32), done (bool)
+
+in preallocated ring arrays (12 bytes per transition) and gather observation
+batches by fancy-indexing each ticker's feature matrix in place: nothing is
+copied but the batch, and with a feature_store.FeatureStore all buffers and
+environments index the same shared arrays. Sources without an in-memory
+matrix (feature_chunks.ChunkedDataSource) page the sampled rows in through
+their window_batch().
+
+    buffer = ReplayBuffer.from_envs(100000, envs)   # one env per ticker id
+    row = env.current_row                            # row of the state s
+    _, reward, done, _, _ = env.step(action)
+    buffer.add(ticker_id, row, action, reward, done)
+    batch = buffer.sample(512)                       # batch.observations, ...
+
+With a VectorTradingEnvironment, add the whole step at once with
+rows=venv.current_rows taken before step(). PrioritizedReplayBuffer samples
+proportionally to priority ** alpha with a vectorized sum tree and returns
+importance-sampling weights; feed the new TD errors back with
+update_priorities(batch.indices, td_errors).
+
+With window=k (environments created with the same window), observations are
+gathered as (batch, k, n_features) windows of the last k rows.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from trading_env import sliding_windows
+
+Batch = namedtuple('Batch', ['observations', 'actions', 'rewards', 'next_observations',
+                             'dones', 'indices', 'weights'])
+
+
+class ReplayBuffer:
+    """Uniform replay of (ticker id, row, action, reward, done) transitions
+
+    features is a list, indexed by ticker id, of per-ticker 2-D feature
+    arrays (the DataSource.data values, not copied) or of data sources that
+    page rows in through window_batch(rows). Batches are returned as dtype.
+    """
+
+    def __init__(self, capacity, features, dtype=np.float32, seed=None, window=None):
+        self.capacity = capacity
+        self.dtype = dtype
+        self.window = window
+        self.features = list(features)
+        self.lengths = np.array([len(f) for f in self.features], dtype=np.int64)
+        # windows never cross tickers: windowed episodes start at row window - 1
+        self._first = 0 if window is None else window - 1
+        self._observations = []
+        for f in self.features:
+            if not isinstance(f, np.ndarray):
+                if f.window != window:
+                    raise ValueError('source of {} has window {}, buffer has {}'.format(
+                        f.ticker, f.window, window))
+                self._observations.append(f)
+            elif window is None:
+                self._observations.append(f)
+            else:
+                self._observations.append(sliding_windows(f, window))
+        self.ticker_ids = np.zeros(capacity, dtype=np.int16)
+        self.rows = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_envs(cls, capacity, envs, **kwargs):
+        """Indexes the features of (Vector)TradingEnvironments; the position
+        of an env in envs is its ticker id"""
+        return cls(capacity, [env.data_source if env.data_source.data is None
+                              else env.data_source.data.values for env in envs], **kwargs)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, ticker_ids, rows, actions, rewards, dones):
+        """Appends one transition (scalars) or a batch (arrays); returns the
+        buffer indices written"""
+        rows = np.atleast_1d(rows)
+        n = len(rows)
+        if n > self.capacity:
+            raise ValueError('batch of {} transitions exceeds capacity {}'.format(n, self.capacity))
+        indices = (self.position + np.arange(n)) % self.capacity
+        self.ticker_ids[indices] = ticker_ids
+        self.rows[indices] = rows
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.dones[indices] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return indices
+
+    def gather(self, indices):
+        """Returns the Batch of the transitions at indices (unit weights)"""
+        ticker_ids = self.ticker_ids[indices]
+        rows = self.rows[indices].astype(np.int64)
+        # s' is the next row; a ticker's last row only ends done transitions
+        next_rows = np.minimum(rows + 1, self.lengths[ticker_ids] - 1)
+        n = len(indices)
+        observations = self._observe(np.r_[ticker_ids, ticker_ids], np.r_[rows, next_rows])
+        return Batch(observations[:n], self.actions[indices], self.rewards[indices],
+                     observations[n:], self.dones[indices], indices,
+                     np.ones(n, dtype=np.float32))
+
+    def _observe(self, ticker_ids, rows):
+        """Gathers the observations at rows of their tickers, one fancy index
+        (or window_batch) per ticker in the batch"""
+        batch = None
+        for ticker_id in np.unique(ticker_ids):
+            selected = ticker_ids == ticker_id
+            observations = self._observations[ticker_id]
+            if isinstance(observations, np.ndarray):
+                values = observations[rows[selected] - self._first]
+            else:
+                values = observations.window_batch(rows[selected])
+            if batch is None:
+                batch = np.empty((len(rows),) + values.shape[1:], dtype=self.dtype)
+            batch[selected] = values
+        return batch
+
+    def sample(self, batch_size):
+        if not self.size:
+            raise ValueError('cannot sample from an empty replay buffer')
+        return self.gather(self.rng.integers(0, self.size, batch_size))
+
+
+class SumTree:
+    """Binary sum tree over capacity leaves, updated and searched in batches"""
+
+    def __init__(self, capacity):
+        self.leaves = 1 << max(int(capacity - 1).bit_length(), 0)
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves)  # tree[1] is the root
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[self.leaves + np.asarray(indices)]
+
+    def update(self, indices, values):
+        """Sets leaf values and recomputes their ancestors level by level"""
+        nodes = self.leaves + np.asarray(indices)
+        self.tree[nodes] = values
+        for _ in range(self.depth):
+            nodes = nodes >> 1  # duplicate parents just write the same sum
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Returns the leaf indices whose cumulative-sum intervals contain values"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            right = values >= left_sum
+            values -= np.where(right, left_sum, 0)
+            nodes = left + right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """Proportional prioritized replay (Schaul et al., 2015)
+
+    Transitions are sampled with probability p_i ** alpha / sum_k p_k ** alpha;
+    new transitions get the highest priority seen so far. Importance-sampling
+    weights (N * P(i)) ** -beta are normalized by the batch maximum.
+    """
+
+    def __init__(self, capacity, features, alpha=0.6, beta=0.4, eps=1e-6, **kwargs):
+        super().__init__(capacity, features, **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def add(self, ticker_ids, rows, actions, rewards, dones):
+        indices = super().add(ticker_ids, rows, actions, rewards, dones)
+        self.tree.update(indices, self.max_priority ** self.alpha)
+        return indices
+
+    def sample(self, batch_size, beta=None):
+        """Stratified sample: one transition from each of batch_size equal
+        slices of the total priority mass"""
+        if not self.size:
+            raise ValueError('cannot sample from an empty replay buffer')
+        beta = self.beta if beta is None else beta
+        total = self.tree.total
+        bounds = np.linspace(0, total, batch_size + 1)
+        values = self.rng.uniform(bounds[:-1], bounds[1:])
+        indices = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))),
+                             self.size - 1)
+        probabilities = self.tree[indices] / total
+        weights = (self.size * probabilities) ** -beta
+        batch = self.gather(indices)
+        return batch._replace(weights=(weights / weights.max()).astype(np.float32))
+
+    def update_priorities(self, indices, td_errors):
+        """Sets the priorities of sampled transitions to |td_error| + eps"""
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
@@ -0,0 +1,273 @@
+"""
+Process-pool rollout collector for multi-ticker experience gathering
+
+RolloutCollector runs n_workers processes. Each worker owns one
+VectorTradingEnvironment per ticker in its share of the tickers and, on every
+collect(), steps all of them rollout_length times with actions from the
+current policy snapshot.
+
+Nothing is pickled per transition:
+- ticker features are published once to a FeatureStore and attached
+  zero-copy by the workers,
+- the policy parameters live in a shared memory array that update_policy()
+  overwrites; workers copy it when its version changes,
+- transitions are written by each worker into its own columns of
+  preallocated shared memory arrays of shape (rollout_length, n_envs, ...).
+
+The policy is a picklable top-level function policy(params, observations,
+rng) returning an int array of actions (0: SHORT, 1: HOLD, 2: LONG) for an
+(n, n_features) float32 observation batch.
+
+Worker w seeds its environments and its policy rng from
+np.random.SeedSequence(seed).spawn(n_workers)[w], so a collector with the
+same seed, tickers and worker count yields the same transitions.
+"""
+
+import logging
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from feature_store import FeatureStore, attach_segment
+from trading_env import CACHE_DIR, DATA_PATH, VectorTradingEnvironment
+
+log = logging.getLogger(__name__)
+
+
+def random_policy(params, observations, rng):
+    """Uniformly random actions; ignores params"""
+    return rng.integers(0, 3, size=len(observations))
+
+
+def linear_epsilon_greedy_policy(params, observations, rng):
+    """Greedy actions of linear Q-values, random with probability params[0]
+
+    params holds [epsilon, W (n_features x 3, row-major), b (3)].
+    """
+    n_features = observations.shape[1]
+    epsilon = params[0]
+    weights = params[1:1 + 3 * n_features].reshape(n_features, 3)
+    bias = params[1 + 3 * n_features:4 + 3 * n_features]
+    actions = np.argmax(observations @ weights + bias, axis=1)
+    explore = rng.random(len(observations)) < epsilon
+    actions[explore] = rng.integers(0, 3, size=explore.sum())
+    return actions
+
+
+class SharedArrays:
+    """Named NumPy arrays packed into one shared memory segment"""
+
+    def __init__(self, spec, name=None):
+        """spec is a list of (name, shape, dtype); name attaches to a segment"""
+        self.spec = spec
+        offsets, size = [], 0
+        for _, shape, dtype in spec:
+            offsets.append(size)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            size += -(-nbytes // 64) * 64  # keep every array 64-byte aligned
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.owner = True
+        else:
+            self.shm = attach_segment(name)
+            self.owner = False
+        self.arrays = {key: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                       for (key, shape, dtype), offset in zip(spec, offsets)}
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker(worker_id, conn, tickers, first_env, envs_per_ticker, env_kwargs,
+            store_prefix, buffer_name, buffer_spec, params_name, params_spec,
+            policy, seed_sequence):
+    """Worker process loop: waits for commands on conn"""
+    buffers = params = store = None
+    try:
+        store = FeatureStore(prefix=store_prefix, data_path=env_kwargs['data_path'],
+                             cache_dir=env_kwargs['cache_dir'])
+        buffers = SharedArrays(buffer_spec, name=buffer_name)
+        params = SharedArrays(params_spec, name=params_name)
+        env_seed, policy_seed = seed_sequence.spawn(2)
+        env_seeds = env_seed.generate_state(len(tickers))
+        rng = np.random.default_rng(policy_seed)
+
+        envs = []
+        for ticker, env_seed in zip(tickers, env_seeds):
+            env = VectorTradingEnvironment(n_envs=envs_per_ticker, ticker=ticker,
+                                           store=store, **env_kwargs)
+            env.seed(int(env_seed))
+            envs.append(env)
+        n_envs = len(envs) * envs_per_ticker
+        columns = slice(first_env, first_env + n_envs)
+        observations = np.concatenate([env.reset() for env in envs]).astype(np.float32)
+        version, snapshot = -1, None
+        conn.send(('ready', worker_id))
+
+        while True:
+            command = conn.recv()
+            if command is None:
+                break
+            if params.arrays['version'][0] != version:
+                version = params.arrays['version'][0]
+                snapshot = params.arrays['params'].copy()
+
+            out = buffers.arrays
+            for t in range(command):
+                actions = np.asarray(policy(snapshot, observations, rng), dtype=np.int64)
+                out['observations'][t, columns] = observations
+                out['actions'][t, columns] = actions
+                next_observations = np.empty_like(observations)
+                for k, env in enumerate(envs):
+                    rows = slice(k * envs_per_ticker, (k + 1) * envs_per_ticker)
+                    obs, rewards, dones, _, info = env.step(actions[rows])
+                    out['rewards'][t, first_env + rows.start:first_env + rows.stop] = rewards
+                    out['dones'][t, first_env + rows.start:first_env + rows.stop] = dones
+                    next_observations[rows] = obs
+                    final = next_observations[rows].copy()
+                    if dones.any():
+                        final[dones] = info['final_observation']
+                    out['next_observations'][t, first_env + rows.start:first_env + rows.stop] = final
+                observations = next_observations
+            conn.send(('done', worker_id))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        for shared in (buffers, params):
+            if shared is not None:
+                shared.close()
+        if store is not None:
+            store.close()
+        conn.close()
+
+
+class RolloutCollector:
+    """Collects transitions from many tickers with a pool of worker processes
+
+    collect() returns views into the shared transition arrays:
+    observations and next_observations (rollout_length, n_envs, n_features)
+    float32, actions int8, rewards float64 and dones bool, each
+    (rollout_length, n_envs). The views are overwritten by the next collect();
+    use collect(copy=True) to keep them. env_tickers maps each of the n_envs
+    columns to its ticker.
+    """
+
+    def __init__(self, tickers, policy=random_policy, params=None,
+                 n_workers=None, envs_per_ticker=4, rollout_length=128,
+                 trading_days=252, trading_cost_bps=1e-3, time_cost_bps=1e-4,
+                 seed=0, data_path=DATA_PATH, cache_dir=CACHE_DIR,
+                 store_prefix='dlweek', start_method=None, timeout=600):
+        self.tickers = list(tickers)
+        self.n_workers = min(n_workers or mp.cpu_count(), len(self.tickers))
+        self.envs_per_ticker = envs_per_ticker
+        self.rollout_length = rollout_length
+        self.timeout = timeout
+        self.workers = []
+        self.conns = []
+
+        # preprocess every ticker once; workers only attach
+        self.store = FeatureStore(prefix=store_prefix, data_path=data_path, cache_dir=cache_dir)
+        self.store.preload(self.tickers)
+        n_features = self.store.array(self.tickers[0]).shape[1]
+
+        self.n_envs = len(self.tickers) * envs_per_ticker
+        shape = (rollout_length, self.n_envs)
+        buffer_spec = [('observations', shape + (n_features,), np.float32),
+                       ('next_observations', shape + (n_features,), np.float32),
+                       ('actions', shape, np.int8),
+                       ('rewards', shape, np.float64),
+                       ('dones', shape, np.bool_)]
+        params = np.zeros(0, dtype=np.float64) if params is None else np.asarray(params, dtype=np.float64)
+        params_spec = [('version', (1,), np.int64), ('params', params.shape, np.float64)]
+        self.buffers = SharedArrays(buffer_spec)
+        self.params = SharedArrays(params_spec)
+        self.params.arrays['params'][:] = params
+
+        ctx = mp.get_context(start_method)
+        env_kwargs = {'trading_days': trading_days,
+                      'trading_cost_bps': trading_cost_bps,
+                      'time_cost_bps': time_cost_bps,
+                      'data_path': data_path,
+                      'cache_dir': cache_dir}
+        shares = np.array_split(np.array(self.tickers, dtype=object), self.n_workers)
+        seeds = np.random.SeedSequence(seed).spawn(self.n_workers)
+        self.env_tickers = []
+        first_env = 0
+        try:
+            for worker_id, (share, seed_sequence) in enumerate(zip(shares, seeds)):
+                parent, child = ctx.Pipe()
+                process = ctx.Process(target=_worker, daemon=True,
+                                      args=(worker_id, child, list(share), first_env,
+                                            envs_per_ticker, env_kwargs, store_prefix,
+                                            self.buffers.name, buffer_spec,
+                                            self.params.name, params_spec,
+                                            policy, seed_sequence))
+                process.start()
+                child.close()
+                self.workers.append(process)
+                self.conns.append(parent)
+                self.env_tickers += [ticker for ticker in share for _ in range(envs_per_ticker)]
+                first_env += len(share) * envs_per_ticker
+            self._wait('ready')
+        except Exception:
+            self.close()
+            raise
+        log.info('started {} rollout workers for {} tickers'.format(self.n_workers, len(self.tickers)))
+
+    def _wait(self, expected):
+        for conn in self.conns:
+            if not conn.poll(self.timeout):
+                raise TimeoutError('rollout worker did not answer within {}s'.format(self.timeout))
+            status, payload = conn.recv()
+            if status != expected:
+                raise RuntimeError('rollout worker failed:\n{}'.format(payload))
+
+    def update_policy(self, params):
+        """Publishes a new policy snapshot; used from the next collect() on"""
+        self.params.arrays['params'][:] = params
+        self.params.arrays['version'][0] += 1
+
+    def collect(self, copy=False):
+        """Steps all environments rollout_length times; returns the transitions"""
+        for conn in self.conns:
+            conn.send(self.rollout_length)
+        self._wait('done')
+        if copy:
+            return {key: value.copy() for key, value in self.buffers.arrays.items()}
+        return dict(self.buffers.arrays)
+
+    def close(self):
+        """Stops the workers and releases all shared memory"""
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for conn in self.conns:
+            conn.close()
+        self.workers, self.conns = [], []
+        if self.buffers is not None:
+            self.buffers.close()
+            self.params.close()
+            self.buffers = self.params = None
+        self.store.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,210 @@
+"""
+Cross-sectional market screener for the dashboard
+
+Computes, for every ticker of a (dates x tickers) close price matrix at once:
+
+- close, change, pct_change       last close and change from the previous close
+- return_<n>d                     return over the last n trading days
+- sma50, sma200, above_sma50,     the moving averages at the last close, whether
+  above_sma200, golden_cross      the close is above them and SMA50 > SMA200
+- volatility                      annualized std of the last 63 daily returns
+- drawdown, max_drawdown          current and largest decline from the peak close
+- dma_sharpe                      Sharpe ratio of the DMA(50, 200) crossover
+                                  strategy, as computed by dma_backtest
+
+The screener keeps the last few hundred rows of the matrix plus running
+per-ticker state (peak close, largest drawdown, DMA strategy return moments),
+so update() with new bars only processes those bars and that tail instead of
+the whole history.
+
+    screener = Screener.from_store(price_store, stock_df)
+    screener.table(sectors=['Information Technology'])
+    screener.update(new_closes)        # dates x tickers, dates after screener.last_date
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from dma_backtest import TRADING_DAYS, moving_averages, price_matrix
+from trading_env import simulate_episodes
+
+log = logging.getLogger(__name__)
+
+PERIODS = (5, 21, 63, 252)
+VOLATILITY_WINDOW = 63
+FAST, SLOW = 50, 200
+# the DMA position and cost of day t depend on day t - 1, so an update
+# re-simulates the last two known days before the new ones
+OVERLAP = 2
+
+
+def _forward_fill(closes, seed):
+    """Forward-fills NaNs down the rows, starting from the seed row"""
+    filled = np.concatenate([seed[None], closes])
+    rows = np.where(np.isnan(filled), 0, np.arange(len(filled))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(filled, rows, axis=0)[1:]
+
+
+class Screener:
+    """Screening metrics of all tickers, updated incrementally with new bars
+
+    prices is a dates x tickers DataFrame of closes (NaN before listing);
+    info optionally has Ticker, Company and Sector columns.
+    """
+
+    def __init__(self, prices, info=None, periods=PERIODS, trading_cost_bps=1e-3, time_cost_bps=1e-4):
+        self.tickers = prices.columns.values
+        self.periods = tuple(periods)
+        self.trading_cost_bps = trading_cost_bps
+        self.time_cost_bps = time_cost_bps
+        self.history = max(max(self.periods) + 1, SLOW + OVERLAP, VOLATILITY_WINDOW + 1)
+        info = pd.DataFrame(columns=['Ticker', 'Company', 'Sector']) if info is None else info
+        info = info.drop_duplicates('Ticker').set_index('Ticker').reindex(self.tickers)
+        self.companies = info['Company'].values
+        self.sectors = info['Sector'].values
+
+        n = len(self.tickers)
+        self.dates = np.empty(0, dtype='datetime64[ns]')
+        self.closes = np.empty((0, n))     # raw tail, NaN where no bar
+        self.filled = np.empty((0, n))     # tail forward-filled per ticker
+        self.last_close = np.full(n, np.nan)
+        self.listed = np.zeros(n, dtype=bool)
+        self.peak = np.full(n, np.nan)
+        self.max_drawdown = np.zeros(n)
+        # running count, mean and sum of squared deviations of DMA strategy returns
+        self.count = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self._table = None
+        self.update(prices)
+
+    @classmethod
+    def from_store(cls, price_store, info=None, **kwargs):
+        """Builds the screener from a PriceStore's long-format frame"""
+        return cls(price_matrix(price_store.frame), info, **kwargs)
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.dates[-1]) if len(self.dates) else None
+
+    def update(self, new_prices):
+        """Appends the bars of new_prices (dates x tickers closes) dated after
+        last_date; unknown tickers are ignored. Returns the number of new dates"""
+        new_prices = new_prices.sort_index()
+        if len(self.dates):
+            new_prices = new_prices[new_prices.index > self.last_date]
+        unknown = new_prices.columns.difference(self.tickers)
+        if len(unknown):
+            log.warning('ignoring unknown tickers {}'.format(list(unknown)))
+        new = new_prices.reindex(columns=self.tickers).values.astype(np.float64)
+        if not len(new):
+            return 0
+
+        kept = len(self.closes)
+        closes = np.concatenate([self.closes, new])
+        listed = np.maximum.accumulate(np.concatenate([self.listed[None], ~np.isnan(new)]), axis=0)[1:]
+        self._update_dma(closes, kept, listed)
+        self._update_drawdowns(new)
+
+        self.filled = np.concatenate([self.filled, _forward_fill(new, self.last_close)])[-self.history:]
+        self.closes = closes[-self.history:]
+        self.dates = np.concatenate([self.dates, pd.DatetimeIndex(new_prices.index).values])[-self.history:]
+        self.last_close = self.filled[-1]
+        self.listed = listed[-1]
+        self._table = None
+        return len(new)
+
+    def _update_dma(self, closes, kept, listed):
+        """Simulates the DMA strategy over the new rows of closes (the last
+        len(closes) - kept) and adds their returns to the running moments"""
+        averages = moving_averages(closes, [FAST, SLOW])
+        fast, slow = averages[FAST], averages[SLOW]
+        actions = np.where(fast > slow, 2, 0)
+        actions = np.where(np.isnan(fast) | np.isnan(slow), 1, actions)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            market_returns = np.nan_to_num(closes[1:] / closes[:-1] - 1, nan=0, posinf=0, neginf=0)
+        market_returns = np.concatenate([np.zeros((1, closes.shape[1])), market_returns])
+        tail_listed = np.concatenate([np.repeat(self.listed[None], kept, axis=0), listed])
+        start = max(kept - OVERLAP, 0)
+        result = simulate_episodes(actions[start:].T, market_returns[start:].T,
+                                   self.trading_cost_bps, self.time_cost_bps, mask=tail_listed[start:].T)
+        returns = result['strategy_return'][:, kept - start:].T
+        # Chan et al.'s parallel update of the moments with the new listed days
+        n = listed.sum(axis=0)
+        batch_mean = np.where(listed, returns, 0).sum(axis=0) / np.maximum(n, 1)
+        batch_m2 = np.where(listed, (returns - batch_mean) ** 2, 0).sum(axis=0)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * n / total, 0)
+            self.m2 = self.m2 + batch_m2 + np.where(total > 0, delta ** 2 * self.count * n / total, 0)
+        self.count = total
+
+    def _update_drawdowns(self, new):
+        peaks = np.fmax.accumulate(np.concatenate([self.peak[None], new]), axis=0)[1:]
+        with np.errstate(invalid='ignore'):
+            drawdowns = np.nan_to_num(1 - new / peaks, nan=0)
+        self.peak = peaks[-1]
+        self.max_drawdown = np.maximum(self.max_drawdown, drawdowns.max(axis=0))
+
+    def _compute(self):
+        n_rows = len(self.filled)
+        valid = ~np.isnan(self.closes)
+        # row of each ticker's last bar in the tail (-1: none)
+        last = np.where(valid.any(axis=0), n_rows - 1 - np.argmax(valid[::-1], axis=0), -1)
+
+        def at(values, back):
+            rows = last - back
+            picked = np.take_along_axis(values, np.maximum(rows, 0)[None], axis=0)[0]
+            return np.where((rows >= 0) & (last >= 0), picked, np.nan)
+
+        close = at(self.filled, 0)
+        previous = at(self.filled, 1)
+        columns = {'company': self.companies,
+                   'sector': self.sectors,
+                   'close': close,
+                   'change': close - previous}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['pct_change'] = close / previous - 1
+            for period in self.periods:
+                columns['return_{}d'.format(period)] = close / at(self.filled, period) - 1
+
+            averages = moving_averages(self.closes, [FAST, SLOW])
+            sma50, sma200 = at(averages[FAST], 0), at(averages[SLOW], 0)
+            columns.update({'sma50': sma50,
+                            'sma200': sma200,
+                            'above_sma50': close > sma50,
+                            'above_sma200': close > sma200,
+                            'golden_cross': sma50 > sma200})
+
+            returns = self.filled[1:] / self.filled[:-1] - 1
+            window = returns[-VOLATILITY_WINDOW:]
+            finite = np.isfinite(window)
+            counts = finite.sum(axis=0)
+            mean = np.where(finite, window, 0).sum(axis=0) / np.maximum(counts, 1)
+            variance = np.where(finite, (window - mean) ** 2, 0).sum(axis=0) / (counts - 1)
+            columns['volatility'] = np.where(counts > 1, np.sqrt(variance * TRADING_DAYS), np.nan)
+            columns['drawdown'] = 1 - close / self.peak
+            columns['max_drawdown'] = self.max_drawdown
+            columns['dma_sharpe'] = np.sqrt(TRADING_DAYS) * self.mean / np.sqrt(
+                self.m2 / np.maximum(self.count - 1, 1))
+        table = pd.DataFrame(columns, index=pd.Index(self.tickers, name='ticker'))
+        return table[last >= 0]
+
+    def table(self, sectors=None):
+        """Returns the metrics of all tickers with a price, or of those in
+        sectors; computed once per update"""
+        if self._table is None:
+            self._table = self._compute()
+        if not sectors:
+            return self._table
+        return self._table[self._table['sector'].isin(sectors)]
+
+    def recent_closes(self, ticker, days=20):
+        """Returns the last days closes of ticker (a Series indexed by date)"""
+        column = int(np.flatnonzero(self.tickers == ticker)[0])
+        closes = pd.Series(self.closes[:, column], index=pd.DatetimeIndex(self.dates)).dropna()
+        return closes.iloc[-days:]
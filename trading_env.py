@@ -24,7 +24,9 @@ SOFTWARE.
 """
 
 import logging
+import os
 import tempfile
+import time
 
 import gym
 import numpy as np
@@ -34,11 +36,31 @@ from gym.utils import seeding
 from sklearn.preprocessing import scale
 #import talib
 
+import feature_cache
+import instrumentation
+import trajectory_log
+
 logging.basicConfig()
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 log.info('%s logger started.', __name__)
 
+DATA_PATH = '../nasdaq100_stock_prices_plus_features.csv'
+CACHE_DIR = 'auto'  # the feature cache next to data_path
+TICKERS_FILE = 'nasdaq100_tickers.csv'  # ticker, company, sector; next to data_path by default
+
+
+def sliding_windows(features, window):
+    """Returns all windows of window consecutive rows of a C-contiguous 2-D
+    array as a read-only (n - window + 1, window, n_features) strided view;
+    windows[i] holds rows i .. i + window - 1"""
+    n, n_features = features.shape
+    row, col = features.strides
+    return np.lib.stride_tricks.as_strided(features,
+                                           shape=(max(n - window + 1, 0), window, n_features),
+                                           strides=(row, row, col),
+                                           writeable=False)
+
 
 class DataSource:
     """
@@ -55,18 +77,48 @@ class DataSource:
     CAT     14155
     DIS     14155
 
+    Data is read through the columnar feature cache in cache_dir (built from
+    data_path on first use, next to it by default); pass cache_dir=None to
+    parse the CSV directly.
+    With a feature_store.FeatureStore, the preprocessed data is instead
+    attached zero-copy from the store.
+    With an instrumentation.Registry (metrics), load/preprocess durations and
+    frame sizes and the take_step phase are recorded.
+    With window=k, take_step returns (k, n_features) float32 windows of the
+    last k days (views of self.windows, no copies) and episodes start at
+    row k - 1 or later, so that every window is complete.
     """
 
-    def __init__(self, trading_days=252, ticker='ADBE', normalize=True):
+    def __init__(self, trading_days=252, ticker='ADBE', normalize=True,
+                 data_path=DATA_PATH, cache_dir=CACHE_DIR, store=None, metrics=None,
+                 window=None):
         self.ticker = ticker
         self.trading_days = trading_days
         self.normalize = normalize
-        self.data = self.load_data()
-        self.preprocess_data()
+        self.data_path = data_path
+        self.metrics = metrics if metrics is not None else instrumentation.default_registry()
+        if self.metrics is not None:
+            self._data_phase = self.metrics.histogram('env_step_seconds', phase='data')
+        if cache_dir == CACHE_DIR:
+            cache_dir = feature_cache.default_cache_dir(data_path)
+        self.cache_dir = cache_dir
+        if store is not None:
+            self.data = store.frame(ticker, normalize=normalize)
+        elif self.metrics is not None:
+            self._load_instrumented()
+        else:
+            self.data = self.load_data()
+            self.preprocess_data()
         self.min_values = self.data.min().values
         self.max_values = self.data.max().values
+        self.window = window
+        if window is not None:
+            self.features = np.ascontiguousarray(self.data.values, dtype=np.float32)
+            self.windows = sliding_windows(self.features, window)
+            self.returns = self.data['returns'].values
         self.step = 0
         self.offset = None
+        self.np_random = None  # set by TradingEnvironment.seed()
 
     def load_data(self):
         log.info('loading data for {}...'.format(self.ticker))
@@ -77,27 +129,60 @@ class DataSource:
         #                ['adj_close', 'adj_volume', 'adj_low', 'adj_high']]
         #           .dropna()
         #           .sort_index())
-        df = pd.read_csv('../nasdaq100_stock_prices_plus_features.csv')
-        df = df[df['ticker'] == self.ticker]
-
-        base_cols = ['open', 'close', 'high', 'low', 'volume', 'month']
-        pattern_cols = [col for col in df.columns
-                        if col.startswith('dollar') or col.startswith('return')]
-        cols_to_keep = base_cols + pattern_cols
-        df = df[cols_to_keep]
+        if self.cache_dir is None:
+            df = pd.read_csv(self.data_path)
+            df = df[df['ticker'] == self.ticker]
+            df = df[self.feature_columns(df.columns)]
+        else:
+            manifest = feature_cache.ensure_cache(self.data_path, self.cache_dir)
+            columns = [spec['name'] for spec in manifest['columns']]
+            df = feature_cache.load_ticker(self.cache_dir, self.ticker,
+                                           columns=self.feature_columns(columns),
+                                           manifest=manifest)
 
         # df.columns = ['close', 'volume', 'low', 'high']
         log.info('got data for {}...'.format(self.ticker))
         return df
 
-    def preprocess_data(self):
-        """calculate returns and percentiles, then removes missing values"""
+    def _load_instrumented(self):
+        started = time.perf_counter()
+        self.data = self.load_data()
+        self._record_stage('load', started)
+        started = time.perf_counter()
+        self.preprocess_data()
+        self._record_stage('preprocess', started)
+
+    def _record_stage(self, stage, started):
+        self.metrics.observe('data_seconds', time.perf_counter() - started, stage=stage)
+        self.metrics.set('data_bytes', int(self.data.memory_usage(deep=True).sum()), stage=stage)
+
+    def load_dates(self):
+        """Returns the dates of the rows of self.data as a DatetimeIndex"""
+        if self.cache_dir is None:
+            df = pd.read_csv(self.data_path, usecols=['date', 'ticker'])
+            df = df[df['ticker'] == self.ticker]
+        else:
+            df = feature_cache.load_ticker(self.cache_dir, self.ticker, columns=['date'])
+        return pd.DatetimeIndex(pd.to_datetime(df['date'].loc[self.data.index]))
+
+    @staticmethod
+    def feature_columns(columns):
+        """Selects the raw columns used by preprocess_data, in file order"""
+        base_cols = ['open', 'close', 'high', 'low', 'volume', 'month']
+        pattern_cols = [col for col in columns
+                        if col.startswith('dollar') or col.startswith('return')]
+        return base_cols + pattern_cols
 
-        self.data['returns'] = self.data.close.pct_change()
-        self.data['ret_2'] = self.data.close.pct_change(2)
-        self.data['ret_5'] = self.data.close.pct_change(5)
-        self.data['ret_10'] = self.data.close.pct_change(10)
-        self.data['ret_21'] = self.data.close.pct_change(21)
+    @staticmethod
+    def compute_features(data):
+        """Returns the unscaled features of raw rows (in file order), without
+        rows with missing values; a row depends on the 21 rows before it"""
+        data = data.copy()
+        data['returns'] = data.close.pct_change()
+        data['ret_2'] = data.close.pct_change(2)
+        data['ret_5'] = data.close.pct_change(5)
+        data['ret_10'] = data.close.pct_change(10)
+        data['ret_21'] = data.close.pct_change(21)
         # self.data['rsi'] = talib.STOCHRSI(self.data.close)[1]
         # self.data['macd'] = talib.MACD(self.data.close)[1]
         # self.data['atr'] = talib.ATR(self.data.high, self.data.low, self.data.close)
@@ -106,12 +191,20 @@ class DataSource:
         # self.data['stoch'] = slowd - slowk
         # self.data['atr'] = talib.ATR(self.data.high, self.data.low, self.data.close)
         # self.data['ultosc'] = talib.ULTOSC(self.data.high, self.data.low, self.data.close)
-        self.data = (self.data.replace((np.inf, -np.inf), np.nan)
-                     .drop(['high', 'low', 'close', 'volume'], axis=1)
-                     .dropna())
+        return (data.replace((np.inf, -np.inf), np.nan)
+                .drop(['high', 'low', 'close', 'volume'], axis=1)
+                .dropna())
+
+    def preprocess_data(self):
+        """calculate returns and percentiles, then removes missing values"""
+        self.data = self.compute_features(self.data)
 
         # self.data = self.data.dropna()
+        self.scale_features()
 
+    def scale_features(self):
+        """Standardizes all features but returns (if normalize) and moves
+        returns to the first column"""
         r = self.data.returns.copy()
         if self.normalize:
             self.data = pd.DataFrame(scale(self.data),
@@ -122,28 +215,150 @@ class DataSource:
         self.data = self.data.loc[:, ['returns'] + list(features)]
         log.info(self.data.info())
 
+    def __len__(self):
+        return len(self.data.index)
+
     def reset(self):
         """Provides starting index for time series and resets step"""
-        high = len(self.data.index) - self.trading_days
-        self.offset = np.random.randint(low=0, high=high)
+        low = 0 if self.window is None else self.window - 1
+        high = len(self) - self.trading_days
+        if self.np_random is None:
+            self.offset = np.random.randint(low=low, high=high)
+        else:
+            self.offset = int(self.np_random.integers(low=low, high=high))
         self.step = 0
 
     def take_step(self):
         """Returns data for current trading day and done signal"""
-        obs = self.data.iloc[self.offset + self.step].values
+        if self.metrics is not None:
+            started = time.perf_counter()
+        if self.window is None:
+            obs = self.data.iloc[self.offset + self.step].values
+        else:
+            obs = self.windows[self.offset + self.step - self.window + 1]
         self.step += 1
         done = self.step > self.trading_days
+        if self.metrics is not None:
+            self._data_phase.observe(time.perf_counter() - started)
         return obs, done
 
+    def market_return(self):
+        """Returns the (unscaled) return of the last returned day"""
+        return self.returns[self.offset + self.step - 1]
+
+    def window_batch(self, rows):
+        """Returns the (len(rows), window, n_features) windows ending at rows
+        (positions in self.data, each >= window - 1) in one gather"""
+        return self.windows[np.asarray(rows) - (self.window - 1)]
+
+
+class PooledDataSource(DataSource):
+    """
+    DataSource over all tickers of a sector (from tickers_path, by default
+    the tickers file next to data_path) or a list
+
+    The features of every member are computed separately, concatenated in
+    member order and normalized jointly, so that one model sees consistent
+    inputs across the sector. Episodes start at a row drawn uniformly from a
+    precomputed index of the valid starts of all members (an episode never
+    crosses from one ticker into the next), so reset() is O(1) whatever the
+    number of members. self.ticker is the ticker of the current episode and
+    self.offset its row in the pooled data; members[ticker] is the
+    (start, stop) row range of a ticker.
+    """
+
+    def __init__(self, trading_days=252, tickers=None, sector=None, tickers_path=None,
+                 normalize=True, data_path=DATA_PATH, cache_dir=CACHE_DIR, metrics=None,
+                 window=None):
+        if tickers is None:
+            if sector is None:
+                raise ValueError('PooledDataSource needs tickers or a sector')
+            if tickers_path is None:
+                tickers_path = os.path.join(os.path.dirname(data_path), TICKERS_FILE)
+            listing = pd.read_csv(tickers_path)
+            tickers = listing.loc[listing['Sector'] == sector, 'Ticker'].tolist()
+            if not tickers:
+                raise ValueError('no tickers in sector {!r}'.format(sector))
+        self.tickers = list(tickers)
+        self.sector = sector
+        super().__init__(trading_days=trading_days, ticker=self.tickers[0], normalize=normalize,
+                         data_path=data_path, cache_dir=cache_dir, metrics=metrics, window=window)
+        self._build_index()
+        self.ticker_id = None
+        self.ticker = None
+
+    def load_data(self):
+        frames = []
+        for ticker in self.tickers:
+            self.ticker = ticker
+            frames.append(super().load_data())
+        self._raw_lengths = [len(frame) for frame in frames]
+        return pd.concat(frames)
+
+    def preprocess_data(self):
+        """Computes the features of each member, then normalizes them jointly"""
+        bounds = np.cumsum([0] + self._raw_lengths)
+        members = [self.compute_features(self.data.iloc[start:stop])
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.data = pd.concat(members)
+        self.scale_features()
+        stops = np.cumsum([len(member) for member in members])
+        starts = stops - [len(member) for member in members]
+        self.members = {ticker: (int(start), int(stop))
+                        for ticker, start, stop in zip(self.tickers, starts, stops)}
+
+    def _build_index(self):
+        """Precomputes the valid episode starts and their ticker ids"""
+        low = 0 if self.window is None else self.window - 1
+        offsets, ticker_ids = [], []
+        for ticker_id, ticker in enumerate(self.tickers):
+            start, stop = self.members[ticker]
+            valid = np.arange(start + low, stop - self.trading_days)
+            if not len(valid):
+                log.warning('{}: too short for an episode of {} days'.format(ticker, self.trading_days))
+            offsets.append(valid)
+            ticker_ids.append(np.full(len(valid), ticker_id, dtype=np.int16))
+        self.valid_offsets = np.concatenate(offsets)
+        self.valid_ticker_ids = np.concatenate(ticker_ids)
+        if not len(self.valid_offsets):
+            raise ValueError('no member is long enough for an episode of {} days'.format(self.trading_days))
+
+    def load_dates(self):
+        """Returns the dates of the rows of self.data as a DatetimeIndex"""
+        if self.cache_dir is None:
+            df = pd.read_csv(self.data_path, usecols=['date', 'ticker'])
+            dates = [df.loc[df['ticker'] == ticker, 'date'] for ticker in self.tickers]
+        else:
+            dates = [feature_cache.load_ticker(self.cache_dir, ticker, columns=['date'])['date']
+                     for ticker in self.tickers]
+        return pd.DatetimeIndex(pd.to_datetime(pd.concat(dates).loc[self.data.index]))
+
+    def reset(self):
+        """Draws the start of the next episode from the valid starts"""
+        if self.np_random is None:
+            i = np.random.randint(len(self.valid_offsets))
+        else:
+            i = int(self.np_random.integers(len(self.valid_offsets)))
+        self.offset = int(self.valid_offsets[i])
+        self.ticker_id = int(self.valid_ticker_ids[i])
+        self.ticker = self.tickers[self.ticker_id]
+        self.step = 0
+
 
 class TradingSimulator:
-    """ Implements core trading simulator for single-instrument univ """
+    """ Implements core trading simulator for single-instrument univ
+
+    With an instrumentation.Registry (metrics), take_step is timed as the
+    simulator phase of env_step_seconds. """
 
-    def __init__(self, steps, trading_cost_bps, time_cost_bps):
+    def __init__(self, steps, trading_cost_bps, time_cost_bps, metrics=None):
         # invariant for object life
         self.trading_cost_bps = trading_cost_bps
         self.time_cost_bps = time_cost_bps
         self.steps = steps
+        self.metrics = metrics if metrics is not None else instrumentation.default_registry()
+        if self.metrics is not None:
+            self._simulator_phase = self.metrics.histogram('env_step_seconds', phase='simulator')
 
         # change every step
         self.step = 0
@@ -171,6 +386,8 @@ class TradingSimulator:
         """ Calculates NAVs, trading costs and reward
             based on an action and latest market return
             and returns the reward and a summary of the day's activity. """
+        if self.metrics is not None:
+            started = time.perf_counter()
 
         start_position = self.positions[max(0, self.step - 1)]
         start_nav = self.navs[max(0, self.step - 1)]
@@ -199,6 +416,8 @@ class TradingSimulator:
                 'costs' : self.costs[self.step]}
 
         self.step += 1
+        if self.metrics is not None:
+            self._simulator_phase.observe(time.perf_counter() - started)
         return reward, info
 
     def result(self):
@@ -213,6 +432,253 @@ class TradingSimulator:
                              'trade'          : self.trades})  # eod trade)
 
 
+def simulate_episodes(actions, market_returns, trading_cost_bps, time_cost_bps, mask=None):
+    """ Runs the TradingSimulator bookkeeping over whole episodes at once
+
+        actions and market_returns have shape (..., steps); every leading
+        index is an independent episode. Returns a dict with the arrays of
+        TradingSimulator.result(), identical to stepping a TradingSimulator
+        through each episode; market_returns (and mask) are broadcast against
+        actions. Where mask is False the asset is not tradable
+        (e.g. not listed yet): no costs are charged and the strategy return is 0. """
+    actions, market_returns = np.broadcast_arrays(np.asarray(actions, dtype=np.float64),
+                                                  np.asarray(market_returns, dtype=np.float64))
+    first = (slice(None),) * (actions.ndim - 1) + (slice(0, 1),)
+    shift = (slice(None),) * (actions.ndim - 1) + (slice(0, -1),)
+    rest = (slice(None),) * (actions.ndim - 1) + (slice(1, None),)
+
+    positions = actions - 1  # short, neutral, long
+    start_positions = np.concatenate([np.zeros_like(positions[first]), positions[shift]], axis=-1)
+    trades = positions - start_positions
+    # roughly value based since starting NAV = 1
+    costs = np.abs(trades) * trading_cost_bps + np.where(trades != 0, 0, time_cost_bps)
+    if mask is not None:
+        costs = np.where(mask, costs, 0)
+    # the first step is charged its own costs, later steps the previous day's
+    start_costs = np.concatenate([costs[first], costs[shift]], axis=-1)
+    strategy_returns = start_positions * market_returns - start_costs
+    if mask is not None:
+        strategy_returns = np.where(mask, strategy_returns, 0)
+
+    navs = np.concatenate([np.ones_like(positions[first]),
+                           np.cumprod(1 + strategy_returns[rest], axis=-1)], axis=-1)
+    market_navs = np.concatenate([np.ones_like(positions[first]),
+                                  np.cumprod(1 + market_returns[rest], axis=-1)], axis=-1)
+    return {'action'         : actions,
+            'nav'            : navs,
+            'market_nav'     : market_navs,
+            'market_return'  : market_returns,
+            'strategy_return': strategy_returns,
+            'position'       : positions,
+            'cost'           : costs,
+            'trade'          : trades}
+
+
+class VectorTradingSimulator:
+    """ Implements TradingSimulator for n_envs independent episodes in lockstep
+
+        State arrays have shape (n_envs, steps); row i evolves exactly like
+        the arrays of a TradingSimulator fed with the actions and market
+        returns of episode i. """
+
+    def __init__(self, n_envs, steps, trading_cost_bps, time_cost_bps):
+        # invariant for object life
+        self.n_envs = n_envs
+        self.trading_cost_bps = trading_cost_bps
+        self.time_cost_bps = time_cost_bps
+        self.steps = steps
+        self.envs = np.arange(n_envs)
+
+        # change every step
+        self.step = np.zeros(n_envs, dtype=np.int64)
+        self.actions = np.zeros((n_envs, steps))
+        self.navs = np.ones((n_envs, steps))
+        self.market_navs = np.ones((n_envs, steps))
+        self.strategy_returns = np.zeros((n_envs, steps))
+        self.positions = np.zeros((n_envs, steps))
+        self.costs = np.zeros((n_envs, steps))
+        self.trades = np.zeros((n_envs, steps))
+        self.market_returns = np.zeros((n_envs, steps))
+
+    def reset(self, mask=None):
+        """ Resets all episodes, or only those where mask is True """
+        rows = slice(None) if mask is None else mask
+        self.step[rows] = 0
+        self.actions[rows] = 0
+        self.navs[rows] = 1
+        self.market_navs[rows] = 1
+        self.strategy_returns[rows] = 0
+        self.positions[rows] = 0
+        self.costs[rows] = 0
+        self.trades[rows] = 0
+        self.market_returns[rows] = 0
+
+    def take_step(self, actions, market_returns):
+        """ Calculates NAVs, trading costs and rewards for all episodes
+            based on their actions and latest market returns
+            and returns the rewards and a summary of the day's activity. """
+        envs, step = self.envs, self.step
+        prev = np.maximum(0, step - 1)
+
+        start_position = self.positions[envs, prev]
+        start_nav = self.navs[envs, prev]
+        start_market_nav = self.market_navs[envs, prev]
+        self.market_returns[envs, step] = market_returns
+        self.actions[envs, step] = actions
+
+        end_position = actions - 1  # short, neutral, long
+        n_trades = end_position - start_position
+        self.positions[envs, step] = end_position
+        self.trades[envs, step] = n_trades
+
+        # roughly value based since starting NAV = 1
+        trade_costs = np.abs(n_trades) * self.trading_cost_bps
+        time_cost = np.where(n_trades != 0, 0, self.time_cost_bps)
+        self.costs[envs, step] = trade_costs + time_cost
+        # read after the write above: on the first step prev == step
+        rewards = start_position * market_returns - self.costs[envs, prev]
+        self.strategy_returns[envs, step] = rewards
+
+        started = step != 0
+        self.navs[envs[started], step[started]] = (start_nav * (1 + rewards))[started]
+        self.market_navs[envs[started], step[started]] = (start_market_nav * (1 + market_returns))[started]
+
+        info = {'reward': rewards,
+                'nav'   : self.navs[envs, step],
+                'costs' : self.costs[envs, step]}
+
+        self.step += 1
+        return rewards, info
+
+    def result(self, env=0):
+        """returns the current state of one episode as pd.DataFrame """
+        return pd.DataFrame({'action'         : self.actions[env],
+                             'nav'            : self.navs[env],
+                             'market_nav'     : self.market_navs[env],
+                             'market_return'  : self.market_returns[env],
+                             'strategy_return': self.strategy_returns[env],
+                             'position'       : self.positions[env],
+                             'cost'           : self.costs[env],
+                             'trade'          : self.trades[env]})
+
+
+class PortfolioSimulator:
+    """ Implements the trading simulator for a portfolio of n_assets
+
+        State arrays have shape (steps, n_assets); column i evolves exactly
+        like the arrays of a TradingSimulator fed with the actions and market
+        returns of asset i, and every step is one set of array operations
+        over the asset axis. Where mask is False an asset is not tradable
+        (as in simulate_episodes): no costs are charged and its return is 0.
+
+        Capital is split equally across the assets tradable on a day
+        (rebalanced daily): the portfolio return is the mean strategy return
+        of the tradable assets and the benchmark the mean market return. """
+
+    def __init__(self, n_assets, steps, trading_cost_bps, time_cost_bps):
+        # invariant for object life
+        self.n_assets = n_assets
+        self.trading_cost_bps = trading_cost_bps
+        self.time_cost_bps = time_cost_bps
+        self.steps = steps
+
+        # change every step
+        self.step = 0
+        self.actions = np.zeros((steps, n_assets))
+        self.navs = np.ones((steps, n_assets))
+        self.market_navs = np.ones((steps, n_assets))
+        self.strategy_returns = np.zeros((steps, n_assets))
+        self.positions = np.zeros((steps, n_assets))
+        self.costs = np.zeros((steps, n_assets))
+        self.trades = np.zeros((steps, n_assets))
+        self.market_returns = np.zeros((steps, n_assets))
+        self.portfolio_returns = np.zeros(steps)
+        self.portfolio_navs = np.ones(steps)
+        self.benchmark_returns = np.zeros(steps)
+        self.benchmark_navs = np.ones(steps)
+        self.n_tradable = np.zeros(steps, dtype=np.int64)
+
+    def reset(self):
+        self.step = 0
+        for values in (self.actions, self.strategy_returns, self.positions, self.costs,
+                       self.trades, self.market_returns, self.portfolio_returns,
+                       self.benchmark_returns, self.n_tradable):
+            values.fill(0)
+        for values in (self.navs, self.market_navs, self.portfolio_navs, self.benchmark_navs):
+            values.fill(1)
+
+    def take_step(self, actions, market_returns, mask=None):
+        """ Calculates per-asset and portfolio NAVs, trading costs and rewards
+            based on the actions and latest market returns of all assets;
+            returns the portfolio reward and a summary of the day's activity. """
+        step, prev = self.step, max(0, self.step - 1)
+
+        start_position = self.positions[prev].copy()  # row prev is row step on the first step
+        start_nav = self.navs[prev]
+        start_market_nav = self.market_navs[prev]
+        self.market_returns[step] = market_returns
+        self.actions[step] = actions
+
+        end_position = actions - 1  # short, neutral, long
+        n_trades = end_position - start_position
+        self.positions[step] = end_position
+        self.trades[step] = n_trades
+
+        # roughly value based since starting NAV = 1
+        trade_costs = np.abs(n_trades) * self.trading_cost_bps
+        time_cost = np.where(n_trades != 0, 0, self.time_cost_bps)
+        self.costs[step] = trade_costs + time_cost
+        if mask is not None:
+            self.costs[step, ~mask] = 0
+        # read after the write above: on the first step prev == step
+        rewards = start_position * market_returns - self.costs[prev]
+        if mask is not None:
+            rewards[~mask] = 0
+        self.strategy_returns[step] = rewards
+
+        n = self.n_assets if mask is None else int(np.count_nonzero(mask))
+        reward = rewards.sum() / max(n, 1)
+        market_return = (market_returns.sum() if mask is None else market_returns[mask].sum()) / max(n, 1)
+        self.portfolio_returns[step] = reward
+        self.benchmark_returns[step] = market_return
+        self.n_tradable[step] = n
+
+        if step != 0:
+            self.navs[step] = start_nav * (1 + rewards)
+            self.market_navs[step] = start_market_nav * (1 + market_returns)
+            self.portfolio_navs[step] = self.portfolio_navs[prev] * (1 + reward)
+            self.benchmark_navs[step] = self.benchmark_navs[prev] * (1 + market_return)
+
+        info = {'reward'       : reward,
+                'nav'          : self.portfolio_navs[step],
+                'costs'        : self.costs[step].sum() / max(n, 1),
+                'asset_rewards': rewards,
+                'asset_navs'   : self.navs[step]}
+
+        self.step += 1
+        return reward, info
+
+    def result(self, asset=0):
+        """returns the current state of one asset as pd.DataFrame """
+        return pd.DataFrame({'action'         : self.actions[:, asset],
+                             'nav'            : self.navs[:, asset],
+                             'market_nav'     : self.market_navs[:, asset],
+                             'market_return'  : self.market_returns[:, asset],
+                             'strategy_return': self.strategy_returns[:, asset],
+                             'position'       : self.positions[:, asset],
+                             'cost'           : self.costs[:, asset],
+                             'trade'          : self.trades[:, asset]})
+
+    def portfolio_result(self):
+        """returns the portfolio state as pd.DataFrame """
+        return pd.DataFrame({'nav'            : self.portfolio_navs,
+                             'market_nav'     : self.benchmark_navs,
+                             'strategy_return': self.portfolio_returns,
+                             'market_return'  : self.benchmark_returns,
+                             'cost'           : self.costs.sum(axis=1) / np.maximum(self.n_tradable, 1),
+                             'n_tradable'     : self.n_tradable})
+
+
 class TradingEnvironment(gym.Env):
     """A simple trading environment for reinforcement learning.
 
@@ -232,6 +698,23 @@ class TradingEnvironment(gym.Env):
     If the NAV hits 2.0, the agent wins.
 
     The trading simulator tracks a buy-and-hold strategy as benchmark.
+
+    With an instrumentation.Registry (metrics, or the global one once
+    enabled), step phases, resets and data loading are timed.
+
+    With window=k (e.g. for an LSTM policy), observations are the (k,
+    n_features) float32 windows of the last k days, as zero-copy views; see
+    DataSource.window_batch() to gather many windows at once.
+
+    With a trajectory_log.TrajectoryRecorder (recorder), every finished
+    episode is appended to its log.
+
+    With chunk_dir (see feature_chunks.py), the features are read from
+    memory-mapped chunk files one episode at a time.
+
+    With sector (of tickers_path, by default nasdaq100_tickers.csv next to
+    data_path) or a list of tickers, the episodes are drawn from all of them (see PooledDataSource); the ticker
+    of the current episode is data_source.ticker.
     """
     metadata = {'render.modes': ['human']}
 
@@ -239,40 +722,326 @@ class TradingEnvironment(gym.Env):
                  trading_days=252,
                  trading_cost_bps=1e-3,
                  time_cost_bps=1e-4,
-                 ticker='AAPL'):
+                 ticker='AAPL',
+                 data_path=DATA_PATH,
+                 cache_dir=CACHE_DIR,
+                 store=None,
+                 metrics=None,
+                 window=None,
+                 recorder=None,
+                 chunk_dir=None,
+                 tickers=None,
+                 sector=None,
+                 tickers_path=None):
         self.trading_days = trading_days
         self.trading_cost_bps = trading_cost_bps
         self.ticker = ticker
         self.time_cost_bps = time_cost_bps
-        self.data_source = DataSource(trading_days=self.trading_days,
-                                      ticker=ticker)
+        self.window = window
+        self.recorder = recorder
+        self.metrics = metrics if metrics is not None else instrumentation.default_registry()
+        if tickers is not None or sector is not None:
+            if store is not None or chunk_dir is not None:
+                raise ValueError('tickers/sector cannot be combined with store or chunk_dir')
+            self.data_source = PooledDataSource(trading_days=self.trading_days,
+                                                tickers=tickers,
+                                                sector=sector,
+                                                tickers_path=tickers_path,
+                                                data_path=data_path,
+                                                cache_dir=cache_dir,
+                                                metrics=self.metrics,
+                                                window=window)
+        elif chunk_dir is not None:
+            from feature_chunks import ChunkedDataSource
+            self.data_source = ChunkedDataSource(trading_days=self.trading_days,
+                                                 ticker=ticker,
+                                                 chunk_dir=chunk_dir,
+                                                 metrics=self.metrics,
+                                                 window=window)
+        else:
+            self.data_source = DataSource(trading_days=self.trading_days,
+                                          ticker=ticker,
+                                          data_path=data_path,
+                                          cache_dir=cache_dir,
+                                          store=store,
+                                          metrics=self.metrics,
+                                          window=window)
         self.simulator = TradingSimulator(steps=self.trading_days,
                                           trading_cost_bps=self.trading_cost_bps,
-                                          time_cost_bps=self.time_cost_bps)
+                                          time_cost_bps=self.time_cost_bps,
+                                          metrics=self.metrics)
+        if self.metrics is not None:
+            self._assert_phase = self.metrics.histogram('env_step_seconds', phase='assert')
+            self._step_total = self.metrics.histogram('env_step_seconds', phase='total')
+            self._reset_seconds = self.metrics.histogram('env_reset_seconds')
+            self._steps = self.metrics.counter('env_steps_total')
+            self._episodes = self.metrics.counter('env_episodes_total')
+            self._resets = self.metrics.counter('env_resets_total')
         self.action_space = spaces.Discrete(3)
-        self.observation_space = spaces.Box(self.data_source.min_values,
-                                            self.data_source.max_values)
+        if window is None:
+            self.observation_space = spaces.Box(self.data_source.min_values,
+                                                self.data_source.max_values)
+        else:
+            self.observation_space = spaces.Box(np.tile(self.data_source.min_values, (window, 1)),
+                                                np.tile(self.data_source.max_values, (window, 1)),
+                                                dtype=np.float32)
         self.reset()
 
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
+        self.data_source.np_random = self.np_random
         return [seed]
 
     def step(self, action):
         """Returns state observation, reward, done and info"""
+        if self.metrics is not None:
+            return self._step_instrumented(action)
+        assert self.action_space.contains(action), '{} {} invalid'.format(action, type(action))
+        observation, done = self.data_source.take_step()
+        market_return = observation[0] if self.window is None else self.data_source.market_return()
+        reward, info = self.simulator.take_step(action=action,
+                                                market_return=market_return)
+        if done and self.recorder is not None:
+            self.recorder.record(self.simulator, self.data_source.ticker, self.data_source.offset)
+        return observation, reward, done, False, info
+
+    def _step_instrumented(self, action):
+        """step() timing the assert phase and the whole step; the data and
+        simulator phases are timed by DataSource and TradingSimulator"""
+        started = time.perf_counter()
         assert self.action_space.contains(action), '{} {} invalid'.format(action, type(action))
+        self._assert_phase.observe(time.perf_counter() - started)
         observation, done = self.data_source.take_step()
+        market_return = observation[0] if self.window is None else self.data_source.market_return()
         reward, info = self.simulator.take_step(action=action,
-                                                market_return=observation[0])
+                                                market_return=market_return)
+        self._step_total.observe(time.perf_counter() - started)
+        self._steps.inc()
+        if done:
+            self._episodes.inc()
+            if self.recorder is not None:
+                self.recorder.record(self.simulator, self.data_source.ticker, self.data_source.offset)
         return observation, reward, done, False, info
 
     def reset(self):
         """Resets DataSource and TradingSimulator; returns first observation"""
+        if self.metrics is not None:
+            started = time.perf_counter()
         self.data_source.reset()
         self.simulator.reset()
-        return self.data_source.take_step()[0]
+        observation = self.data_source.take_step()[0]
+        if self.metrics is not None:
+            self._reset_seconds.observe(time.perf_counter() - started)
+            self._resets.inc()
+        return observation
+
+    @property
+    def current_row(self):
+        """Position in data_source.data of the last returned observation"""
+        return self.data_source.offset + self.data_source.step - 1
 
     # TODO
     def render(self, mode='human'):
         """Not implemented"""
         pass
+
+
+class VectorTradingEnvironment(gym.Env):
+    """Runs n_envs independent TradingEnvironment episodes in lockstep.
+
+    All episodes trade the same ticker. step() takes an array of n_envs
+    actions and returns arrays of observations (n_envs, n_features), rewards
+    and done flags; all bookkeeping is done with NumPy over the episode axis
+    by a VectorTradingSimulator.
+
+    Each episode draws its own random start offset. Episodes that finish are
+    reset automatically: their row of the returned observations is already
+    the first observation of the next episode and the last observation of the
+    finished one is in info['final_observation'].
+
+    With seed([s_0, ..., s_n-1]) (or seed(s), meaning s + i for episode i),
+    episode i reproduces a TradingEnvironment seeded with s_i.
+
+    With a trajectory_log.TrajectoryRecorder (recorder), finished episodes
+    are appended to its log before they are reset.
+    """
+    metadata = {'render.modes': ['human']}
+
+    def __init__(self,
+                 n_envs=16,
+                 trading_days=252,
+                 trading_cost_bps=1e-3,
+                 time_cost_bps=1e-4,
+                 ticker='AAPL',
+                 data_path=DATA_PATH,
+                 cache_dir=CACHE_DIR,
+                 store=None,
+                 recorder=None):
+        self.n_envs = n_envs
+        self.trading_days = trading_days
+        self.trading_cost_bps = trading_cost_bps
+        self.ticker = ticker
+        self.time_cost_bps = time_cost_bps
+        self.recorder = recorder
+        self.data_source = DataSource(trading_days=self.trading_days,
+                                      ticker=ticker,
+                                      data_path=data_path,
+                                      cache_dir=cache_dir,
+                                      store=store)
+        self.features = np.ascontiguousarray(self.data_source.data.values)
+        self.simulator = VectorTradingSimulator(n_envs=n_envs,
+                                                steps=self.trading_days,
+                                                trading_cost_bps=self.trading_cost_bps,
+                                                time_cost_bps=self.time_cost_bps)
+        self.action_space = spaces.MultiDiscrete(np.full(n_envs, 3))
+        self.observation_space = spaces.Box(np.tile(self.data_source.min_values, (n_envs, 1)),
+                                            np.tile(self.data_source.max_values, (n_envs, 1)))
+        self.np_randoms = None
+        self.offsets = np.zeros(n_envs, dtype=np.int64)
+        self.steps = np.zeros(n_envs, dtype=np.int64)
+        self.reset()
+
+    def seed(self, seed=None):
+        if seed is None or np.isscalar(seed):
+            seed = [None if seed is None else seed + i for i in range(self.n_envs)]
+        seeded = [seeding.np_random(s) for s in seed]
+        self.np_randoms = [rng for rng, _ in seeded]
+        return [s for _, s in seeded]
+
+    def _draw_offsets(self, envs):
+        high = len(self.features) - self.trading_days
+        if self.np_randoms is None:
+            return np.random.randint(low=0, high=high, size=len(envs))
+        return np.array([self.np_randoms[i].integers(low=0, high=high) for i in envs],
+                        dtype=np.int64)
+
+    def _reset_envs(self, mask):
+        envs = np.flatnonzero(mask)
+        self.offsets[envs] = self._draw_offsets(envs)
+        self.steps[envs] = 1  # the first observation is returned by reset
+        self.simulator.reset(mask)
+        return self.features[self.offsets[envs]]
+
+    def step(self, actions):
+        """Returns state observations, rewards, dones, truncateds and info"""
+        actions = np.asarray(actions)
+        assert self.action_space.contains(actions), '{} {} invalid'.format(actions, type(actions))
+        observations = self.features[self.offsets + self.steps]
+        self.steps += 1
+        dones = self.steps > self.trading_days
+        rewards, info = self.simulator.take_step(actions=actions,
+                                                 market_returns=observations[:, 0])
+        if dones.any():
+            info['final_observation'] = observations[dones]
+            if self.recorder is not None:
+                self.recorder.append({name: getattr(self.simulator, attr)[dones]
+                                      for name, attr in trajectory_log.COLUMNS.items()},
+                                     self.ticker, self.offsets[dones])
+            observations[dones] = self._reset_envs(dones)
+        return observations, rewards, dones, np.zeros(self.n_envs, dtype=bool), info
+
+    def reset(self):
+        """Resets all episodes; returns the first observations"""
+        return self._reset_envs(np.ones(self.n_envs, dtype=bool))
+
+    @property
+    def current_rows(self):
+        """Positions in features of the last returned observations"""
+        return self.offsets + self.steps - 1
+
+    def render(self, mode='human'):
+        """Not implemented"""
+        pass
+
+
+class PortfolioEnvironment(gym.Env):
+    """Trades a list of tickers together on a common date index.
+
+    The features of every ticker are aligned on the union of their dates into
+    features (dates, tickers, features); listed (dates, tickers) is False
+    where a ticker has no row on a date (before its listing or its first
+    complete feature row, e.g. ABNB or APP), and its features are 0 there.
+
+    Each day step() takes one action per ticker (0: SHORT, 1: HOLD, 2: LONG)
+    and returns the observations (tickers, features), the equal-weighted
+    portfolio reward and info with the per-asset rewards, NAVs and the listed
+    mask. Actions for unlisted tickers are ignored (held flat, no costs). A
+    ticker listed over a whole episode is simulated exactly as by a
+    TradingEnvironment of that ticker with the same actions.
+    """
+    metadata = {'render.modes': ['human']}
+
+    def __init__(self,
+                 tickers,
+                 trading_days=252,
+                 trading_cost_bps=1e-3,
+                 time_cost_bps=1e-4,
+                 data_path=DATA_PATH,
+                 cache_dir=CACHE_DIR,
+                 store=None):
+        self.tickers = list(tickers)
+        self.trading_days = trading_days
+        self.trading_cost_bps = trading_cost_bps
+        self.time_cost_bps = time_cost_bps
+        sources = [DataSource(trading_days=trading_days,
+                              ticker=ticker,
+                              data_path=data_path,
+                              cache_dir=cache_dir,
+                              store=store)
+                   for ticker in self.tickers]
+        dates = [source.load_dates() for source in sources]
+        self.dates = dates[0].append(dates[1:]).unique().sort_values()
+        self.date_values = self.dates.values
+        n_features = sources[0].data.shape[1]
+        self.features = np.zeros((len(self.dates), len(self.tickers), n_features))
+        self.listed = np.zeros((len(self.dates), len(self.tickers)), dtype=bool)
+        for i, (source, ticker_dates) in enumerate(zip(sources, dates)):
+            rows = self.dates.get_indexer(ticker_dates)
+            self.features[rows, i] = source.data.values
+            self.listed[rows, i] = True
+        self.simulator = PortfolioSimulator(n_assets=len(self.tickers),
+                                            steps=self.trading_days,
+                                            trading_cost_bps=self.trading_cost_bps,
+                                            time_cost_bps=self.time_cost_bps)
+        self.action_space = spaces.MultiDiscrete(np.full(len(self.tickers), 3))
+        self.observation_space = spaces.Box(
+            np.stack([source.min_values for source in sources]),
+            np.stack([source.max_values for source in sources]))
+        self.np_random = None
+        self.offset = None
+        self.step_count = 0
+        self.reset()
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def step(self, actions):
+        """Returns state observations, portfolio reward, done and info"""
+        actions = np.asarray(actions)
+        assert (actions.shape == self.action_space.shape and
+                actions.min() >= 0 and actions.max() <= 2), '{} {} invalid'.format(actions, type(actions))
+        row = self.offset + self.step_count
+        observations, listed = self.features[row], self.listed[row]
+        self.step_count += 1
+        done = self.step_count > self.trading_days
+        reward, info = self.simulator.take_step(actions=np.where(listed, actions, 1),
+                                                market_returns=observations[:, 0],
+                                                mask=listed)
+        info.update({'date': self.date_values[row], 'listed': listed})
+        return observations, reward, done, False, info
+
+    def reset(self):
+        """Draws a start date, resets the simulator; returns first observations"""
+        high = len(self.dates) - self.trading_days
+        if self.np_random is None:
+            self.offset = np.random.randint(low=0, high=high)
+        else:
+            self.offset = int(self.np_random.integers(low=0, high=high))
+        self.simulator.reset()
+        self.step_count = 1  # the first observation is returned by reset
+        return self.features[self.offset]
+
+    def render(self, mode='human'):
+        """Not implemented"""
+        pass
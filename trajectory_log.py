@@ -0,0 +1,200 @@
+"""
+Memory-mapped columnar log of finished trading episodes
+
+TradingSimulator.result() builds a DataFrame per call and reset() overwrites
+the simulator arrays. A TrajectoryRecorder instead appends the arrays of each
+finished episode as one row of preallocated memory-mapped (episodes, steps)
+column files, next to an episode table (episode id, ticker, start offset):
+
+    path/meta.json            steps, columns, tickers, number of episodes
+    path/<column>.npy         action, nav, market_nav, ... (episodes, steps)
+    path/episode.npy, ticker_id.npy, offset.npy
+
+Pass a recorder to TradingEnvironment or VectorTradingEnvironment
+(recorder=...) and every episode is recorded when it is done. TrajectoryLog
+reads a log back as zero-copy views, per-episode frames, or pyarrow
+tables/record batches and Parquet (pyarrow is only needed for those).
+
+    with TrajectoryRecorder('logs/run1', steps=252) as recorder:
+        env = TradingEnvironment(ticker='ADBE', recorder=recorder)
+        ...
+    log = TrajectoryLog('logs/run1')
+    log['nav'][:, -1]                  # final NAVs of all episodes, no copy
+    log.to_parquet('run1.parquet')
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# result() column -> TradingSimulator attribute
+COLUMNS = {'action': 'actions',
+           'nav': 'navs',
+           'market_nav': 'market_navs',
+           'market_return': 'market_returns',
+           'strategy_return': 'strategy_returns',
+           'position': 'positions',
+           'cost': 'costs',
+           'trade': 'trades'}
+EPISODE_COLUMNS = {'episode': np.int64, 'ticker_id': np.int32, 'offset': np.int64}
+META = 'meta.json'
+
+
+def _column_path(path, name):
+    return os.path.join(path, name + '.npy')
+
+
+class TrajectoryRecorder:
+    """Appends finished episodes to a memory-mapped columnar log in path"""
+
+    def __init__(self, path, steps, capacity=1024, dtype=np.float64, flush_every=256):
+        self.path = path
+        self.steps = steps
+        self.dtype = np.dtype(dtype)
+        self.flush_every = flush_every
+        self.tickers = []
+        self._ticker_ids = {}
+        self.size = 0
+        self.next_episode = 0
+        os.makedirs(path, exist_ok=True)
+        self._open(capacity)
+
+    def _open(self, capacity, copy_from=None):
+        """(Re)creates the column files with room for capacity episodes"""
+        columns = {}
+        specs = [(name, self.dtype, (capacity, self.steps)) for name in COLUMNS]
+        specs += [(name, dtype, (capacity,)) for name, dtype in EPISODE_COLUMNS.items()]
+        for name, dtype, shape in specs:
+            target = _column_path(self.path, name)
+            tmp = target + '.tmp'
+            column = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+            if copy_from is not None:
+                column[:self.size] = copy_from[name][:self.size]
+                del copy_from[name]  # close the old map before replacing its file
+            column.flush()
+            del column
+            os.replace(tmp, target)
+            columns[name] = np.load(target, mmap_mode='r+')
+        self.columns = columns
+        self.capacity = capacity
+
+    def _ticker_id(self, ticker):
+        if ticker not in self._ticker_ids:
+            self._ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return self._ticker_ids[ticker]
+
+    def append(self, arrays, ticker, offsets, episodes=None):
+        """Appends n episodes: arrays maps every column to (n, steps) values;
+        offsets (and episode ids, default: sequential) have length n"""
+        offsets = np.atleast_1d(offsets)
+        n = len(offsets)
+        if self.size + n > self.capacity:
+            self._open(max(2 * self.capacity, self.size + n), copy_from=self.columns)
+        rows = slice(self.size, self.size + n)
+        for name in COLUMNS:
+            self.columns[name][rows] = arrays[name]
+        if episodes is None:
+            episodes = np.arange(self.next_episode, self.next_episode + n)
+        self.columns['episode'][rows] = episodes
+        self.columns['ticker_id'][rows] = self._ticker_id(ticker)
+        self.columns['offset'][rows] = offsets
+        self.next_episode = int(np.max(episodes)) + 1
+        self.size += n
+        if self.size % self.flush_every < n:
+            self.flush()
+
+    def record(self, simulator, ticker, offset, episode=None):
+        """Appends the episode held by a TradingSimulator"""
+        self.append({name: getattr(simulator, attr)[None] for name, attr in COLUMNS.items()},
+                     ticker, offset, None if episode is None else [episode])
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+        meta = {'steps': self.steps,
+                'size': self.size,
+                'capacity': self.capacity,
+                'dtype': self.dtype.str,
+                'columns': list(COLUMNS),
+                'tickers': self.tickers}
+        tmp = os.path.join(self.path, META + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, META))
+
+    def close(self):
+        self.flush()
+        self.columns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryLog:
+    """Read-only access to a log written by TrajectoryRecorder"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+        self.size = self.meta['size']
+        self.steps = self.meta['steps']
+        self.tickers = self.meta['tickers']
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        """Returns a read-only (episodes, steps) view of a column, or the
+        (episodes,) episode, ticker_id or offset column"""
+        return np.load(_column_path(self.path, name), mmap_mode='r')[:self.size]
+
+    def episodes(self):
+        """Returns the episode table (episode, ticker, offset)"""
+        return pd.DataFrame({'episode': self['episode'],
+                             'ticker': np.array(self.tickers, dtype=object)[self['ticker_id']],
+                             'offset': self['offset']})
+
+    def episode(self, i):
+        """Returns episode i (by position) as TradingSimulator.result() would"""
+        return pd.DataFrame({name: self[name][i] for name in COLUMNS})
+
+    def to_arrow(self, columns=None, start=0, stop=None):
+        """Returns the episodes [start, stop) as a pyarrow Table with one row
+        per episode and fixed-size list columns; numeric data is not copied"""
+        import pyarrow as pa
+
+        stop = self.size if stop is None else min(stop, self.size)
+        episodes = self.episodes().iloc[start:stop]
+        arrays = {'episode': pa.array(episodes['episode'].values),
+                  'ticker': pa.array(episodes['ticker'].values.astype(str)),
+                  'offset': pa.array(episodes['offset'].values)}
+        for name in columns or COLUMNS:
+            values = np.ascontiguousarray(self[name][start:stop]).reshape(-1)
+            arrays[name] = pa.FixedSizeListArray.from_arrays(pa.array(values), self.steps)
+        return pa.table(arrays)
+
+    def record_batches(self, batch_size=1024, columns=None):
+        """Yields pyarrow RecordBatches of batch_size episodes"""
+        for start in range(0, self.size, batch_size):
+            yield from self.to_arrow(columns, start, start + batch_size).to_batches()
+
+    def to_parquet(self, path, batch_size=1024, columns=None):
+        """Writes the log to a Parquet file, batch by batch"""
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for batch in self.record_batches(batch_size, columns):
+                if writer is None:
+                    writer = pq.ParquetWriter(path, batch.schema)
+                writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()